@@ -3,6 +3,8 @@ import os
 import random
 import asyncio
 import re
+import signal
+import time
 
 from discord import guild
 from discord import embeds
@@ -17,34 +19,48 @@ from DemonOverlord.core.util.config import (
     APIConfig,
 )
 
-from DemonOverlord.core.util.command import Command
-from DemonOverlord.core.util.responses import WelcomeResponse
+from DemonOverlord.core.util.command import Command, CommandRegistry
+from DemonOverlord.core.util.ratelimit import RateLimiter
+from DemonOverlord.core.util.sessions import SessionRouter
+from DemonOverlord.core.util.members import MemberCache
+from DemonOverlord.core.util.metrics import metrics
+from DemonOverlord.core.util.snapshot import ConfigError
+from DemonOverlord.core.util.responses import WelcomeResponse, WelcomeTemplate
 from DemonOverlord.core.util.logger import (
     LogCommand,
     LogMessage,
     LogHeader,
     LogFormat,
     LogType,
+    log,
 )
 
 
-class DemonOverlord(discord.Client):
+class DemonOverlord(discord.AutoShardedClient):
     """
-    This class is the main bot class, which represents the client's connection to discord
+    This class is the main bot class, which represents the client's connection to discord.
+    It runs one or more shards, see the shard layouts in config.json. With multiple processes,
+    every process runs its own group of shards (`shard_ids`) and `process` is its index.
     """
 
-    def __init__(self, argv: list, workdir):
+    def __init__(self, argv: list, workdir, shard_ids: list = None, process: int = 0):
         # initialize properties
         self.config = None
         self.commands = None
         self.database = None
+        self.registry = None
+        self.limiter = None
+        self.sessions = SessionRouter()
+        self.member_cache = None
         self.local = False
+        self.process = process
         self._db_ready = asyncio.Event()
+        self._reload_lock = asyncio.Lock()
 
-        print(LogHeader("Initializing Bot"))
+        log(LogHeader("Initializing Bot"))
 
         confdir = os.path.join(workdir, "config")
-        print(
+        log(
             LogMessage(
                 f"WORKDIR: {LogFormat.format(workdir, LogFormat.UNDERLINE)}", time=False
             )
@@ -53,59 +69,170 @@ class DemonOverlord(discord.Client):
         # set the main bot config
         self.config = BotConfig(self, confdir, argv)
         self.commands = CommandConfig(confdir)
+        self.registry = CommandRegistry(self.commands)
+        self.limiter = RateLimiter(
+            self.commands, max_buckets=self.config.raw["ratelimits"]["max_buckets"]
+        )
 
         try:
             self.database = DatabaseConfig(self, confdir)
-            print(LogMessage("Database connection established", time=False))
+
+            # discord.Client runs on this loop as well, so the pool is bound to the right loop
+            asyncio.get_event_loop().run_until_complete(self.database.connect())
+            log(LogMessage("Database connection established", time=False))
         except Exception as e:
             self.local = True
-            print(
+            log(
                 LogMessage(
                     "Database connection not established, running in local mode",
                     msg_type=LogType.WARNING,
                     time=False,
                 )
             )
-            print(LogMessage(f"{type(e).__name__}: {e}", msg_type=LogType.ERROR))
+            log(LogMessage(f"{type(e).__name__}: {e}", msg_type=LogType.ERROR))
         self.api = APIConfig(self.config)
+        asyncio.get_event_loop().run_until_complete(self.api.connect())
+
+        # serve latency histograms and counters for prometheus, every process on its own port
+        metrics_config = self.config.raw["metrics"]
+        if metrics_config["enabled"]:
+            port = metrics_config["port"] + process
+            try:
+                asyncio.get_event_loop().run_until_complete(
+                    metrics.start(metrics_config["host"], port)
+                )
+                log(LogMessage(f"Serving metrics on http://{metrics_config['host']}:{port}/metrics", time=False))
+            except OSError as e:
+                log(LogMessage(f"Could not start the metrics server: {e}", msg_type=LogType.WARNING, time=False))
 
         # initial presence
         presence = random.choice(self.config.status_messages)
         presence_type = str(presence.type).split(".")[1]
-        print(
+        log(
             LogMessage(
                 f"Initial Presence: \"{LogFormat.format(f'{presence_type} {presence.name}', LogFormat.BOLD)}\"",
                 time=False,
             )
         )
 
-        # set intents
-        intents = discord.Intents().all()
-        print(LogMessage(f"set intents to: {intents.value}", time=False))
+        # set intents, only the ones of the mode's intent profile and the ones our modules need
+        options = self.config.client_options(self.registry.intents, self.registry.optional_intents)
+        log(
+            LogMessage(
+                f"set intents to: {options['intents'].value} (profile: {self.config.mode['intent_profile']})",
+                time=False,
+            )
+        )
+
+        # members outside of discord.py's cache are fetched when needed
+        member_lru = self.config.raw["intent_profiles"][self.config.mode["intent_profile"]]["member_lru"]
+        self.member_cache = MemberCache(member_lru["max_size"], member_lru["ttl"])
+
+        # shard layout, the background services only run in the process with the designated shard
+        layout = self.config.shards
+        self.runs_services = shard_ids is None or layout["service_shard"] in shard_ids
+        log(
+            LogMessage(
+                f"shard layout: {layout['name']}, shards {shard_ids if shard_ids is not None else 'all'} of {layout['shard_count'] or 'recommended'}",
+                time=False,
+            )
+        )
 
         # initializing discord client
-        super().__init__(intents=intents, activity=presence)
+        super().__init__(
+            **options,
+            activity=presence,
+            shard_count=layout["shard_count"],
+            shard_ids=shard_ids,
+        )
 
         # initialize our own services
         try:
-            self.loop.create_task(services.change_status(self))
-            self.loop.create_task(services.fetch_steamdata(self))
+            # every process has its own rate limiter to sync and its own command config to reload
+            self.loop.create_task(services.update_ratelimits(self))
+            self.loop.create_task(services.watch_config(self))
+            if self.runs_services:
+                self.loop.create_task(services.change_status(self))
+                self.loop.create_task(services.fetch_steamdata(self))
         except Exception:
-            print(LogMessage("Setup for services failed"))
+            log(LogMessage("Setup for services failed"))
+
+        # admins can reload the command config with `kill -HUP <pid>`
+        try:
+            self.loop.add_signal_handler(signal.SIGHUP, lambda: self.loop.create_task(self.reload_commands()))
+        except (AttributeError, NotImplementedError):
+            # no SIGHUP on windows, the file watcher still works
+            pass
+
+    async def reload_commands(self, force: bool = False) -> bool:
+        """
+        Reload cmd_info.json, interactions.json and izzy.json without reconnecting. The files are parsed and
+        validated in an executor, then the new config is swapped in at once. Running commands keep the config
+        they started with. With `force` the new config is used even if no file changed, so its interaction
+        catalog has the emoji known now. returns True if a new config is in use
+        """
+        async with self._reload_lock:
+            start = time.perf_counter()
+
+            try:
+                commands = await self.loop.run_in_executor(
+                    None, CommandConfig, self.commands.confdir, self.config.izzymojis
+                )
+            except (ConfigError, OSError, ValueError) as e:
+                log(LogMessage(f"Reloading the command config failed, keeping the current one. {e}", msg_type=LogType.ERROR))
+                metrics.inc("config_reloads_total", result="error")
+                return False
+
+            changed = commands.hash != self.commands.hash
+            if not changed and not force:
+                return False
+
+            # no awaits from here on, so no command can see a half updated config
+            self.commands = commands
+            self.registry.update_actions(commands)
+            self.limiter.update_limits(commands)
+
+            if changed:
+                metrics.inc("config_reloads_total", result="ok")
+                log(LogMessage(f"Command config reloaded in {time.perf_counter() - start:.3f}s"))
+            return True
 
     async def wait_until_done(self) -> None:
         await self.wait_until_ready()
         await self._db_ready.wait()
 
     async def on_guild_join(self, guild) -> None:
-        print(LogMessage(f"Joined guild {guild.name}, setting up database..."))
-        await self.database.add_guild(guild.id)
+        log(LogMessage(f"Joined guild {guild.name}, setting up database..."))
+        await self.database.add_guild(guild)
 
     async def on_guild_remove(self, guild) -> None:
-        print(
+        log(
             LogMessage(f"Removed guild {guild.name}, removing all data from database")
         )
-        await self.database.remove_guild(guild.id)
+        await self.database.remove_guild(guild)
+        WelcomeTemplate.invalidate(guild.id)
+
+    # compiled welcome templates contain names and mentions of the guild, its channels and roles
+    async def on_guild_update(self, before: discord.Guild, after: discord.Guild) -> None:
+        WelcomeTemplate.invalidate(after.id)
+
+    async def on_guild_channel_create(self, channel) -> None:
+        WelcomeTemplate.invalidate(channel.guild.id)
+
+    async def on_guild_channel_update(self, before, after) -> None:
+        WelcomeTemplate.invalidate(after.guild.id)
+
+    async def on_guild_channel_delete(self, channel) -> None:
+        WelcomeTemplate.invalidate(channel.guild.id)
+
+    async def on_guild_role_create(self, role: discord.Role) -> None:
+        WelcomeTemplate.invalidate(role.guild.id)
+
+    async def on_guild_role_update(self, before: discord.Role, after: discord.Role) -> None:
+        WelcomeTemplate.invalidate(after.guild.id)
+
+    async def on_guild_role_delete(self, role: discord.Role) -> None:
+        WelcomeTemplate.invalidate(role.guild.id)
 
     async def on_member_join(self, member: discord.Member):
         if self.local or member.pending:
@@ -120,9 +247,9 @@ class DemonOverlord(discord.Client):
                     await member.add_roles(
                         *roles, reason="Automatic Role Assignment", atomic=True
                     )
-                    print(LogMessage("Autorole assigned successfully"))
+                    log(LogMessage("Autorole assigned successfully"))
                 except discord.errors.Forbidden:
-                    print(
+                    log(
                         LogMessage(
                             f"Issue on Server '{member.guild}', permissions missing."
                         )
@@ -130,7 +257,7 @@ class DemonOverlord(discord.Client):
 
         welcome = await self.database.get_welcome(member.guild.id)
         if welcome != None:
-            response = WelcomeResponse(welcome, self, member)
+            response = await WelcomeResponse.create(welcome, self, member)
             await response.channel.send(embed=response)
 
     async def on_member_update(self, before: discord.Member, after: discord.Member):
@@ -150,9 +277,9 @@ class DemonOverlord(discord.Client):
                         await after.add_roles(
                             *roles, reason="Automatic Role Assignment", atomic=True
                         )
-                        print(LogMessage("Autorole assigned successfully"))
+                        log(LogMessage("Autorole assigned successfully"))
                     except discord.errors.Forbidden:
-                        print(
+                        log(
                             LogMessage(
                                 f"Issue on Server '{after.guild}', permissions missing."
                             )
@@ -160,32 +287,34 @@ class DemonOverlord(discord.Client):
 
             welcome = await self.database.get_welcome(after.guild.id, wait_pending=True)
             if welcome != None and welcome["wait_pending"]:
-                welcome = WelcomeResponse(welcome, self, after)
+                welcome = await WelcomeResponse.create(welcome, self, after)
                 await welcome.channel.send(embed=welcome)
 
     async def on_ready(self) -> None:
-        print(LogHeader("CONNECTED SUCCESSFULLY"))
-        print(LogMessage(f"{'USERNAME': <10}: {self.user.name}", time=False))
-        print(LogHeader("loading other data"))
+        log(LogHeader("CONNECTED SUCCESSFULLY"))
+        log(LogMessage(f"{'USERNAME': <10}: {self.user.name}", time=False))
+        log(LogHeader("loading other data"))
 
         # configure all things that need a connection to discord
         try:
             self.config.post_connect(self)
         except Exception:
-            print(
+            log(
                 LogMessage(
                     "Post connection config Failed",
                     msg_type=LogType.WARNING,
                 )
             )
         else:
-            print(LogMessage("Post Connection config Finished"))
+            # the interaction catalog contains the emoji as text, swap in a command config built with them
+            await self.reload_commands(force=True)
+            log(LogMessage("Post Connection config Finished"))
 
         # test the database
-        print(LogMessage("Testing Database..."))
+        log(LogMessage("Testing Database..."))
         if self.local:
             # we're in local mode, no connection exists
-            print(
+            log(
                 LogMessage(
                     "No database configuration, running in local mode, some functions may be limited",
                     msg_type=LogType.WARNING,
@@ -193,54 +322,86 @@ class DemonOverlord(discord.Client):
             )
         else:
             try:
-                # test schemas
-                print(LogMessage("Checking Schemas..."))
-                if not await self.database.schema_test():
-                    print(
-                        LogMessage(
-                            "Some schemas don't exist, correcting...",
-                            msg_type=LogType.WARNING,
-                        )
-                    )
-                    await self.database.schema_fix()
-                else:
-                    print(LogMessage("All schemas are in place."))
-
-                # test tables
-                print(LogMessage("Checking Tables..."))
-                if not await self.database.table_test():
-                    print(
-                        LogMessage(
-                            "Some tables don't exist or are wrong, correcting...",
-                            msg_type=LogType.WARNING,
-                        )
-                    )
-                    await self.database.table_fix()
-                else:
-                    print(LogMessage("All Tables are in place and seem to be correct."))
-
-                # print(LogMessage("Updating Guild status...."))
-                # self.database.update_guilds(self.guilds)
+                # other processes may be verifying the schema right now, the first one fixes it, the others skip
+                async with self.database.schema_lock():
+                    if await self.database.schema_unchanged():
+                        log(LogMessage("Database template and schema unchanged since the last check, skipping."))
+                    else:
+                        await self.verify_database()
+
+                # catch up on guilds we joined or left while we were offline, only on our own shards
+                log(LogMessage("Updating Guild status...."))
+                added, removed = await self.database.update_guilds(
+                    self.guilds, shard_ids=self.shard_ids, shard_count=self.shard_count
+                )
+                log(LogMessage(f"{len(self.guilds)} guilds in sync, {added} added and {removed} removed."))
 
             except Exception as e:
                 # catch all errors and log them
-                print(
+                log(
                     LogMessage(
                         "Something went wrong when testing and/or fixing the database, continuing in local mode",
                         msg_type=LogType.ERROR,
                     )
                 )
-                print(LogMessage(e, msg_type=LogType.ERROR))
+                log(LogMessage(e, msg_type=LogType.ERROR))
                 self.local = True
-        for guild in self.guilds:
-            print(f"Joined guild {guild.name} at {guild.me.joined_at}")
-
         # finish up and send the ready event
-        print(LogHeader("startup done"))
+        log(LogHeader("startup done"))
         self._db_ready.set()
 
+    async def verify_database(self) -> None:
+        """test and fix the database schemas and tables against db_template.json"""
+
+        # test schemas
+        log(LogMessage("Checking Schemas..."))
+        if not await self.database.schema_test():
+            log(
+                LogMessage(
+                    "Some schemas don't exist, correcting...",
+                    msg_type=LogType.WARNING,
+                )
+            )
+            await self.database.schema_fix()
+        else:
+            log(LogMessage("All schemas are in place."))
+
+        # test tables
+        log(LogMessage("Checking Tables..."))
+        if not await self.database.table_test():
+            log(
+                LogMessage(
+                    "Some tables don't exist or are wrong, correcting...",
+                    msg_type=LogType.WARNING,
+                )
+            )
+            await self.database.table_fix()
+            verified = await self.database.table_test()
+        else:
+            log(LogMessage("All Tables are in place and seem to be correct."))
+            verified = True
+
+        # only a verified schema may skip the checks on the next start
+        if verified:
+            await self.database.save_schema_state()
+        else:
+            log(
+                LogMessage(
+                    "Some tables could not be corrected automatically, please check the database.",
+                    msg_type=LogType.WARNING,
+                )
+            )
+            self.database.tables_to_fix.clear()
+
+    async def on_reaction_add(self, reaction: discord.Reaction, user) -> None:
+        self.sessions.dispatch_reaction(reaction, user)
+
     async def on_message(self, message: discord.Message) -> None:
 
+        # messages that belong to a running game or prompt are not commands
+        if self.sessions.dispatch_message(message):
+            return
+
         # handle all commands
         if not message.author.bot and message.content.startswith(
             self.config.mode["prefix"]
@@ -254,11 +415,13 @@ class DemonOverlord(discord.Client):
                     await self.wait_until_done()
 
                     # build the command and execute it
+                    start = time.perf_counter()
                     command = Command(self, message)
-                    print(LogCommand(command))
+                    metrics.observe("command_parse_seconds", time.perf_counter() - start, command=command.labels["command"])
+                    log(LogCommand(command), "command")
                     await command.exec()
             except discord.errors.Forbidden:
-                print(
+                log(
                     LogMessage(
                         "No permission to send to channel", msg_type=LogType.ERROR
                     )
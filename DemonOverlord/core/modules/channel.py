@@ -4,17 +4,12 @@ from DemonOverlord.core.util.responses import TextResponse, BadCommandResponse
 
 
 async def handler(command) -> discord.Embed:
-    print("1")
     if len(command.channels) > 0:
-        print("2")
         if isinstance(command.channels[0], discord.TextChannel):
-            print("3")
             return ChatResponse(command.channels[0])
         else:
-            print("4")
             return BadCommandResponse(command)
     else:
-        print("5")
         return BadCommandResponse(command)
 
 
@@ -4,39 +4,37 @@ from DemonOverlord.core.util.responses import TextResponse, BadCommandResponse
 
 
 async def handler(command) -> discord.Embed:
-
-    # get the command help entry
-    command_help = list(
-        filter(lambda x: x["command"] == command.action, command.bot.commands.list)
-    )
+    commands = command.commands
 
     # if the action is none, we can ignore
     if command.action is None or command.action == "help":
-        return HelpMain(command, command.bot.commands.command_info["help"])
+        command.action = "Main"
+        return commands.responses.get(
+            ("help", None), lambda: HelpMain(command, commands.command_info["help"])
+        )
 
     # if we try to access a category, that has to be handled differently
-    elif command.action in command.bot.commands.command_info:
+    elif command.action in commands.command_info:
+        category = commands.command_info[command.action]
 
         # Some categories are generated. In this case, it is Interactions, which have a custom layout
-        if (
-            len(command.bot.commands.command_info[command.action]["commands"]) == 0
-            and command.action == "interactions"
-        ):
-            return HelpInteractionsCategory(
-                command,
-                command.bot.commands.command_info[command.action],
-                command.bot.commands.interactions,
+        if len(category["commands"]) == 0 and command.action == "interactions":
+            return commands.responses.get(
+                ("help", command.action),
+                lambda: HelpInteractionsCategory(command, category, commands.interactions),
             )
 
         # this is a plain command category
         else:
-            return HelpCommandCategory(
-                command, command.bot.commands.command_info[command.action]
+            return commands.responses.get(
+                ("help", command.action), lambda: HelpCommandCategory(command, category)
             )
 
     # this is the case, if we have a specific command
-    elif len(command_help) > 0:
-        return HelpCommand(command, command_help[0])
+    elif command.action in commands.by_name:
+        return commands.responses.get(
+            ("help", command.action), lambda: HelpCommand(command, commands.by_name[command.action])
+        )
 
     # and this is the default case, in which we return an error
     else:
@@ -50,10 +48,9 @@ async def gen_help(command):
     when not specifying an action.
     """
     command.action = command.command
-    command_help = list(
-        filter(lambda x: x["command"] == command.command, command.bot.commands.list)
+    return command.commands.responses.get(
+        ("help", command.command), lambda: HelpCommand(command, command.commands.by_name[command.command])
     )
-    return HelpCommand(command, command_help[0])
 
 
 # each normal command only gets this.
@@ -82,9 +79,7 @@ class HelpCommandCategory(TextResponse):
         self.actions = None
 
         # parse the action list
-        self.actions = ""
-        for i in self.help["commands"]:
-            self.actions += f'{i["command"]}\n'
+        self.actions = "".join(f'{i["command"]}\n' for i in self.help["commands"])
 
         # add the fields to the embed
         self.add_field(name="Command usage:", value=f"`{self.syntax}`", inline=False)
@@ -103,16 +98,13 @@ class HelpMain(HelpCommandCategory):
 
     def __init__(self, command, help_dict: dict):
         # initialize the super class
-        command.action = "Main"
         super().__init__(command, help_dict)
 
         # give out the full bot syntax
         self.main_syntax = f'`{command.bot.config.mode["prefix"]} {{command}} {{action}} {{parameters}}`'
 
         # add the category string
-        self.categories = ""
-        for i in self.help["categories"]:
-            self.categories += f'{i["command"]}\n'
+        self.categories = "".join(f'{i["command"]}\n' for i in self.help["categories"])
 
         # add all the necessary fields
         self.insert_field_at(
@@ -149,20 +141,19 @@ class HelpCommand(TextResponse):
 
         # parse the actions list or set None if there are no specific actions
         if self.help["actions"] != None:
-            actionlist = ""
+            parts = []
             for i in self.help["actions"]:
                 if i["params"] != None:
-                    paramlist = ""
-                    for j in i["params"]:
-                        paramlist += f'  {j["name"]} - {j["description"]}\n'
+                    paramlist = "".join(f'  {j["name"]} - {j["description"]}\n' for j in i["params"])
                 else:
                     paramlist = None
 
-                actionlist += f'Action      :: {i["action"]}\n'
-                actionlist += f'Description :: {i["description"]}\n'
-                actionlist += f'Usage       :: {command.bot.config.mode["prefix"]} {command.action} {i["usage"]}\n'
-                actionlist += f"Parameters  :: \n  {paramlist}\n" if paramlist else ""
-                actionlist += "\n"
+                parts.append(f'Action      :: {i["action"]}\n')
+                parts.append(f'Description :: {i["description"]}\n')
+                parts.append(f'Usage       :: {command.bot.config.mode["prefix"]} {command.action} {i["usage"]}\n')
+                parts.append(f"Parameters  :: \n  {paramlist}\n" if paramlist else "")
+                parts.append("\n")
+            actionlist = "".join(parts)
         else:
             actionlist = None
 
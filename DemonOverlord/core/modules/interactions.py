@@ -4,60 +4,51 @@ import re
 
 # core imports
 from DemonOverlord.core.util.responses import ImageResponse, BadCommandResponse
-from DemonOverlord.core.util.logger import LogCommand, LogMessage, LogHeader
+from DemonOverlord.core.util.catalog import InteractionEntry
+from DemonOverlord.core.util.logger import LogCommand, LogMessage, LogHeader, LogType, log
+
+# music and game interactions show the activities of the user, those are only sent with presences.
+# without them the interactions are sent without the song or game
+optional_intents = ("presences",)
+
+# mentions in the parameters of a reply
+MENTION = re.compile(r"<@.?\d+>")
 
 
 async def handler(command) -> discord.Embed:
-    # create shortcuts to make life easier
-    alone_interactions = command.bot.commands.interactions["alone"]
-    social_interactions = command.bot.commands.interactions["social"]
-    combine_interactions = command.bot.commands.interactions["combine"]
+    # the compiled interaction, Command already looked it up
+    entry = command.interaction
+    if entry is None:
+        return BadCommandResponse(command)
 
     # what interaction do we have?
-    if command.action in alone_interactions.keys():
-
-        gifs = list(alone_interactions[command.action]["gifs"])
-        index = random.randint(0, len(gifs)-1 if len(gifs)>0 else 0)
-        print(gifs[0], index)
-        url = (
-            gifs[index]
-            if len(gifs) > 0
-            else await command.bot.api.tenor.get_interact(
-                f'anime {alone_interactions[command.action]["query"]}'
-            )
+    if entry.kind == "alone":
 
-        )
+        gifs = entry.gifs
+        index = random.randrange(len(gifs)) if gifs else 0
+        log(LogMessage(lambda: f"Interaction '{entry.name}': gif {index} of {len(gifs)}", msg_type=LogType.DEBUG))
+        url = gifs[index] if gifs else await command.bot.api.tenor.get_interact(f"anime {entry.query}")
 
         # actually create the interaction
         interact = Interaction(
             command.bot,
-            alone_interactions[command.action],
+            entry,
             command.invoked_by,
             url,
             color=0xE2268F,
-            title=f'{command.invoked_by.display_name} {alone_interactions[command.action]["action"]}.',
+            title=f"{command.invoked_by.display_name} {entry.verb}.",
         )
     else:
         # nested function to get mentions of command and make sure if embed title does not get too long
         def get_mentions(everyone: str="") -> list:
-            # initialize list and counter
+            # initialize list and the room left in the title
             mentions = [] if len(everyone) == 0 else [everyone]
-            mentionsLen = len(command.invoked_by.display_name) + len(everyone) + 3
-            if command.action in combine_interactions:
-                mentionsLen += (
-                    len(combine_interactions[command.action]["action"]["social"]) +
-                    len(str(command.bot.config.izzymojis[combine_interactions[command.action]["emoji"]]))
-                )
-            else:
-                mentionsLen += (
-                    len(social_interactions[command.action]["action"]) +
-                    len(str(command.bot.config.izzymojis[social_interactions[command.action]["emoji"]]))
-                )
+            budget = entry.title_budget - len(command.invoked_by.display_name) - len(everyone)
 
             # get mentions and stop iteration when embed title gets too long
             for i in command.mentions:
-                mentionsLen += len(i.display_name) + 2
-                if mentionsLen > 255 - 2:
+                budget -= len(i.display_name) + 2
+                if budget < 0:
                     break
                 mentions.append(i.display_name)
 
@@ -67,7 +58,6 @@ async def handler(command) -> discord.Embed:
         # filter mentions from params. double mentions are ignored
 
         # this is the case where we don't mention everyone
-        regex = re.compile(r"<@.?\d+>")
         if (
             command.params != None
             and len(command.mentions) > 0
@@ -76,7 +66,7 @@ async def handler(command) -> discord.Embed:
             if not command.reference:
                 command.params = command.params[len(command.mentions) :]
             else:
-                command.params = list(filter(lambda x : not regex.match(x), command.params))
+                command.params = list(filter(lambda x : not MENTION.match(x), command.params))
 
             mentions = get_mentions()
 
@@ -89,7 +79,7 @@ async def handler(command) -> discord.Embed:
             if not command.reference:
                 command.params = command.params[len(command.mentions) :]
             else:
-                command.params = list(filter(lambda x : not regex.match(x), command.params)[1:])
+                command.params = list(filter(lambda x : not MENTION.match(x), command.params))[1:]
 
             mentions = get_mentions("everyone")
 
@@ -107,34 +97,25 @@ async def handler(command) -> discord.Embed:
 
 
         # what other type of interaction is this?, just check and try to match
-        if command.action in social_interactions:
+        if entry.kind == "social":
             # no mentions. not good
             if len(mentions) < 1:
                 return BadCommandResponse(command)
 
-            gifs = list(social_interactions[command.action]["gifs"])
-            url = (
-                random.choice(gifs)
-                if len(gifs) > 0
-                else await command.bot.api.tenor.get_interact(
-                    f'anime {social_interactions[command.action]["query"]}'
-                )
-            )
+            url = random.choice(entry.gifs) if entry.gifs else await command.bot.api.tenor.get_interact(f"anime {entry.query}")
 
-            interaction = social_interactions[command.action]
+            interaction = entry
             user = command.invoked_by
             interaction_prev = None
 
-            if command.invoked_by.display_name in mentions and len(interaction["self"]) > 0:
-                if interaction["violent"]:
-                    print(mentions)
-                    url = await command.bot.api.tenor.get_interact(
-                        f'anime {social_interactions["hug"]["query"]}'
-                    )
+            if command.invoked_by.display_name in mentions and len(interaction.self_texts) > 0:
+                if interaction.violent:
+                    log(LogMessage(lambda mentions=list(mentions): f"Violent interaction on self, mentions: {mentions}", msg_type=LogType.DEBUG))
                     interaction_prev = interaction
                     mentions = [command.invoked_by.display_name]
 
-                    interaction = social_interactions["hug"]
+                    interaction = command.commands.catalog.get("hug")
+                    url = await command.bot.api.tenor.get_interact(f"anime {interaction.query}")
                     user = command.bot.user
                 else:
                     interaction_prev = interaction
@@ -144,46 +125,17 @@ async def handler(command) -> discord.Embed:
             )
 
         # these are combine interactions, interactions that are capable of alone AND social interaction behavior
-        elif command.action in combine_interactions.keys():
-            gifs = list(combine_interactions[command.action]["gifs"])
-            index = random.randint(0, len(gifs)-1 if len(gifs)>0 else 0)
-            url = (
-                gifs[index]
-                if len(gifs) > 0
-                else await command.bot.api.tenor.get_interact(
-                    f'anime {combine_interactions[command.action]["query"]}'
-                )
-            )
+        else:
+            gifs = entry.gifs
+            url = random.choice(gifs) if gifs else await command.bot.api.tenor.get_interact(f"anime {entry.query}")
 
-            if combine_interactions[command.action]["type"] == "music":
-                interact = MusicInteraction(
-                    command.bot,
-                    combine_interactions[command.action],
-                    command.invoked_by,
-                    mentions,
-                    url,
-                )
-            elif combine_interactions[command.action]["type"] == "game":
-                
-                interact = GameInteraction(
-                    command.bot,
-                    combine_interactions[command.action],
-                    command.invoked_by,
-                    mentions,
-                    url,
-                )
+            if entry.type == "music":
+                interact = MusicInteraction(command.bot, entry, command.invoked_by, mentions, url)
+            elif entry.type == "game":
+                interact = GameInteraction(command.bot, entry, command.invoked_by, mentions, url)
                 await interact.add_steamdata(command.bot)
             else:
-                interact = CombineInteraction(
-                    command.bot,
-                    combine_interactions[command.action],
-                    command.invoked_by,
-                    mentions,
-                    url,
-                )
-        # this is the default error
-        else:
-            return BadCommandResponse(command)
+                interact = CombineInteraction(command.bot, entry, command.invoked_by, mentions, url)
 
     # add the user's message to the interaction.
     if command.params != None and len(command.params) > 0:
@@ -203,7 +155,7 @@ class Interaction(ImageResponse):
     def __init__(
         self,
         bot: discord.Client,
-        interaction_type: dict,
+        interaction_type: InteractionEntry,
         user: discord.Member,
         url: str,
         title: str = "Interaction",
@@ -214,9 +166,9 @@ class Interaction(ImageResponse):
             title,
             url=url,
             color=color,
-            icon=bot.config.izzymojis[interaction_type["emoji"]],
+            icon=interaction_type.emoji,
         )
-        self.interaction_type = type
+        self.interaction_type = interaction_type
         self.user = user
 
     def add_message(self, msg: str) -> None:
@@ -232,7 +184,7 @@ class SocialInteraction(Interaction):
     def __init__(
         self,
         bot: discord.Client,
-        interaction_type: dict,
+        interaction_type: InteractionEntry,
         user: discord.Member,
         mentions: list,
         url: str,
@@ -246,10 +198,10 @@ class SocialInteraction(Interaction):
         else:
             self.interact_with = f"{mentions[0]}"
 
-        self.title = f'{bot.config.izzymojis[interaction_type["emoji"]]} {user.display_name} {interaction_type["action"]} {self.interact_with}'
+        self.title = f"{interaction_type.emoji} {user.display_name} {interaction_type.verb_social} {self.interact_with}".lstrip(" ")
 
         if not interaction_prev == None:
-            self.description = random.choice(interaction_prev["self"])
+            self.description = random.choice(interaction_prev.self_texts)
 
             
             
@@ -264,7 +216,7 @@ class CombineInteraction(Interaction):
     def __init__(
         self,
         bot,
-        interaction_type: dict,
+        interaction_type: InteractionEntry,
         user: discord.Member,
         mentions: list,
         url: str,
@@ -276,13 +228,13 @@ class CombineInteraction(Interaction):
         # parse the mentions, so we can set them properly or act as base interaction
         if len(mentions) > 1:
             self.interact_with = f'{", ".join(mentions[:-1])} and {mentions[-1]}'
-            self.title = f'{user.display_name} {interaction_type["action"]["social"]} {self.interact_with}'
+            self.title = f"{user.display_name} {interaction_type.verb_social} {self.interact_with}"
 
         elif len(mentions) == 1:
             self.interact_with = f"{mentions[0]}"
-            self.title = f'{user.display_name} {interaction_type["action"]["social"]} {self.interact_with}'
+            self.title = f"{user.display_name} {interaction_type.verb_social} {self.interact_with}"
         else:
-            self.title = f'{bot.config.izzymojis[interaction_type["emoji"]]} {user.display_name} {interaction_type["action"]["alone"]}'
+            self.title = f"{interaction_type.emoji} {user.display_name} {interaction_type.verb}".lstrip(" ")
 
 
 # music interaction, a special case that has both Alone and Social aspects
@@ -295,16 +247,17 @@ class MusicInteraction(CombineInteraction):
     def __init__(
         self,
         bot: discord.Client,
-        interaction_type: dict,
+        interaction_type: InteractionEntry,
         user: discord.Member,
         mentions: list,
         url: str,
     ):
         # initialize the super class
         super().__init__(bot, interaction_type, user, mentions, url, color=0x1DB954)
-        # get the spotify action
+        # get the spotify action, we only know the activities with presences
+        activities = user.activities if bot.intents.presences else ()
         spotify = list(
-            filter(lambda x: isinstance(x, discord.Spotify), user.activities)
+            filter(lambda x: isinstance(x, discord.Spotify), activities)
         )
         self.spotify = spotify[0] if len(spotify) > 0 else None
 
@@ -329,7 +282,7 @@ class GameInteraction(CombineInteraction):
     def __init__(
         self,
         bot: discord.Client,
-        interaction_type: dict,
+        interaction_type: InteractionEntry,
         user: discord.Member,
         mentions: list,
         url: str,
@@ -339,12 +292,13 @@ class GameInteraction(CombineInteraction):
         super().__init__(bot, interaction_type, user, mentions, url, color=0x1DB954)
 
         # get the list of game actions and then the first match. we don't bother selecting a specific one
+        activities = user.activities if bot.intents.presences else ()
         game = list(
             filter(
                 lambda x: isinstance(x, (discord.Game, discord.Streaming))
                 or x.type
                 in (discord.ActivityType.playing, discord.ActivityType.streaming),
-                user.activities,
+                activities,
             )
         )
         self.game = game[0] if len(game) > 0 else None
@@ -10,9 +10,11 @@ async def handler(command):
         return await gen_help(command)
 
     # if we have it: use it. if it's wrong, throw an error
-    elif command.action in command.bot.commands.izzylinks:
+    elif command.action in command.commands.izzylinks:
         try:
-            return IzzyLink(command, command.bot.commands.izzylinks[command.action])
+            return command.commands.responses.get(
+                ("izzy", command.action), lambda: IzzyLink(command, command.commands.izzylinks[command.action])
+            )
         except:
             return BadCommandResponse(command)
 
@@ -39,13 +41,9 @@ class IzzyLink(TextResponse):
         if command.action != "forbidden_fruit":
 
             # get and set the description for the command
-            command_obj = list(
-                filter(lambda x: x["command"] == "izzy", command.bot.commands.list)
-            )[0]
-            action_obj = list(
-                filter(lambda x: x["action"] == command.action, command_obj["actions"])
-            )
-            self.description = action_obj[0]["description"]
+            command_obj = command.commands.by_name["izzy"]
+            action_obj = next(x for x in command_obj["actions"] if x["action"] == command.action)
+            self.description = action_obj["description"]
         else:
             # set the timeout and the description (this is static, no need to load it from config)
             self.timeout = 20
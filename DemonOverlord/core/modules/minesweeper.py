@@ -1,4 +1,4 @@
-from random import randint
+import random
 from time import time
 import discord
 
@@ -8,6 +8,7 @@ from DemonOverlord.core.util.game_responses import (
     GameWonResponse,
 )
 from DemonOverlord.core.util.responses import BadCommandResponse
+from DemonOverlord.core.util.sessions import EditCoalescer
 
 
 async def handler(command) -> None:
@@ -31,7 +32,7 @@ async def handler(command) -> None:
                                 except:
                                     return False
                                 else:
-                                    if x >= 1 and y >= 1 and x <= 10 and y <= 10:
+                                    if x >= 1 and y >= 1 and x <= game_grid.width and y <= game_grid.height:
                                         return True
                         elif make_command[2] == "quit":
                             return True
@@ -43,34 +44,44 @@ async def handler(command) -> None:
         timestamp = int(time())
         game_won = False
         game_grid = generate_game()
+        renderer = GridRenderer(command.bot, game_grid)
         running = True
         reason = "You hit a mine and lost. Better luck next time"
         description = f'This is minesweeper.\nYou can do the following things:\n__Toggle Flag:__\n  `{command.bot.config.mode["prefix"]} ms flag {{x}} {{y}}`\n\n__Reveal a field:__\n  `{command.bot.config.mode["prefix"]} ms reveal {{x}} {{y}}`\n\n__End Game:__\n `{command.bot.config.mode["prefix"]} ms quit`'
         response = await command.message.channel.send(
-            embed=GameResponse(
-                "Minesweeeper", description, get_grid(command.bot, game_grid)
-            )
+            embed=GameResponse("Minesweeeper", description, renderer.render())
+        )
+
+        # moves in quick succession are merged into a single edit
+        editor = EditCoalescer(
+            response,
+            lambda: GameResponse(
+                "Minesweeeper", description, renderer.render(), timestamp=timestamp
+            ),
+        )
+
+        # all moves of the player in this channel are routed to this session
+        session = command.bot.sessions.open(
+            command.channel.id, command.invoked_by.id, check=msg_test
         )
 
         # the main loop of the game.
         while running and not game_won:
             try:
-                message = await command.bot.wait_for(
-                    "message", check=msg_test, timeout=60
-                )
+                message = await session.wait(timeout=60)
                 # we can assume here, that the message has the correct information, based on msg_test
                 make_command = message.content.split(" ")
                 await message.delete()
 
                 # take the specified action
                 if make_command[2] == "flag":
-                    running = game_grid[int(make_command[4]) - 1][
-                        int(make_command[3]) - 1
-                    ].flag()
+                    running = game_grid.flag(
+                        int(make_command[3]) - 1, int(make_command[4]) - 1
+                    )
                 elif make_command[2] == "reveal":
-                    running = game_grid[int(make_command[4]) - 1][
-                        int(make_command[3]) - 1
-                    ].uncover()
+                    running = game_grid.reveal(
+                        int(make_command[3]) - 1, int(make_command[4]) - 1
+                    )
                 elif make_command[2] == "quit":
                     reason = "User ended the game."
                     running = False
@@ -78,18 +89,13 @@ async def handler(command) -> None:
                     break
 
                 # have we won? update win and show status
-                game_won = determine_win(game_grid)
-                await response.edit(
-                    embed=GameResponse(
-                        "Minesweeeper",
-                        description,
-                        get_grid(command.bot, game_grid),
-                        timestamp=timestamp,
-                    )
-                )
+                game_won = game_grid.won
+                editor.update()
             except Exception:
                 running = False
                 reason = "The game timed out after 60 seconds, therefore you lost.\nDon't start something you can't end."
+        session.close()
+        await editor.close()
         await response.delete()
 
         # have we won? send appropriate response and delete message
@@ -97,214 +103,162 @@ async def handler(command) -> None:
             return GameWonResponse(
                 "Minesweeper",
                 "Congratulations, you finished the game without hitting a single bomb.",
-                get_grid(command.bot, game_grid),
+                renderer.render(),
                 timestamp=timestamp,
             )
         else:
             return GameLostResponse(
-                "Minesweeper", reason, get_grid(command.bot, game_grid)
+                "Minesweeper", reason, renderer.render()
             )
 
     return
 
 
-def determine_win(game_grid: list) -> bool:
+class GridRenderer(object):
     """
-    This function determines if the player won.
+    This renders a board into the emoji field that is later shown in the Embed.
+    Rendered rows are cached, only rows the board marked as dirty are rendered again.
     """
-    count = 0
-    for i in game_grid:
-        for j in i:
-            temp = (j.flagged and isinstance(j, BombField)) or (
-                j.uncovered and not isinstance(j, BombField)
-            )
-            if temp:
-                count += 1
-
-    return count == len(game_grid) * len(game_grid[0])
 
+    def __init__(self, bot: discord.Client, board):
+        emoji = bot.config.emoji
+        self.board = board
+
+        # all emoji are looked up once per game
+        self.flag = emoji["minesweeper"]["F"]
+        self.hidden = emoji["minesweeper"]["X"]
+        self.mine = emoji["minesweeper"]["B"]
+        self.numbers = ["🟦"] + [emoji["numbers"][i] for i in range(1, 9)]
+        self.labels = [emoji["numbers"][y + 1] for y in range(board.height)]
+        self.header = emoji["minesweeper"]["N"] + "".join(
+            emoji["numbers"][x + 1] for x in range(board.width)
+        )
 
-def get_grid(bot: discord.Client, game_grid: list) -> str:
-    """
-    This function generates the emoji field that is later shown in the Embed
-    """
-    out = ""
-    out += bot.config.emoji["minesweeper"]["N"]
-    for i in range(1, len(game_grid) + 1):
-        out += bot.config.emoji["numbers"][i]
-    out += "\n"
-
-    # go trough the grid and place everything with its relevant emoji
-    for i in enumerate(game_grid):
-        out += bot.config.emoji["numbers"][i[0] + 1]
-        for j in i[1]:
-            try:
-                out += (
-                    bot.config.emoji["numbers"][int(str(j))] if int(str(j)) > 0 else "🟦"
-                )
-            except Exception:
-                out += bot.config.emoji["minesweeper"][str(j)]
-        out += "\n"
-    return out
-
-
-def generate_game():
-    """
-    This function generates the initial game grid
-    """
-    # the initial list. an empty 10x10 grid.
-    game_grid = [[None] * 10 for x in range(0, 10)]
-
-    # generate the mines, then the numbers
-    game_grid = generate_mines(game_grid)
-    game_grid = generate_numbers(game_grid)
-    return game_grid
+        self.rows = [None] * board.height
+        board.dirty.update(range(board.height))
 
+    def render(self) -> str:
+        board = self.board
+        for y in board.dirty:
+            self.rows[y] = self.render_row(y)
+        board.dirty.clear()
 
-def generate_mines(game_grid: list) -> list:
-    """
-    This function generates the mines on the game grid
-    """
+        return "\n".join((self.header, *self.rows)) + "\n"
 
-    # go through the game grid and generate 11 bombs at random positions
-    for i in range(0, 11):
-        x = randint(0, len(game_grid) - 1)
-        y = randint(0, len(game_grid) - 1)
-        game_grid[y][x] = BombField()
+    def render_row(self, y: int) -> str:
+        board = self.board
+        start = y * board.width
 
-    return game_grid
+        out = [self.labels[y]]
+        for index in range(start, start + board.width):
+            state = board.state[index]
+            if state & FLAGGED:
+                out.append(self.flag)
+            elif state & REVEALED:
+                out.append(self.mine if state & MINE else self.numbers[board.counts[index]])
+            else:
+                out.append(self.hidden)
+        return "".join(out)
 
 
-def generate_numbers(game_field: list) -> list:
+def generate_game(width: int = 10, height: int = 10, density: float = 0.11):
     """
-    This function creates the value and zero fields on the game grid
+    This function generates the initial game board, `density` is the share of fields that are mines
     """
+    return Board(width, height, max(1, round(width * height * density)))
 
-    # this creates an ofset range, so the rest of the code knows where it can or can't check
-    def make_range(num: int) -> list:
-        if num < 1:
-            return range(0, 2)
-        elif num > 8:
-            return range(-1, 1)
-        else:
-            return range(-1, 2)
-
-    # then we just go through the 2D array and generate the numbers around the bombs
-    for y, row in enumerate(game_field):
-        for x, field in enumerate(row):
-            temp_value = 0
-
-            # generate -1, 0 and 1
-            for i in make_range(y):
-                for j in make_range(x):
-                    # we don't have to check our own position
-                    coord_y = y + (1 * i)
-                    coord_x = x + (1 * j)
-                    if (
-                        isinstance(game_field[coord_y][coord_x], BombField)
-                        and (
-                            coord_x,
-                            coord_y,
-                        )
-                        != (x, y)
-                    ):
-                        temp_value += 1
-
-            # if the field isn't a bomb, we can set it
-            if field == None:
-                if temp_value == 0:
-                    game_field[y][x] = ZeroField()
-                else:
-                    game_field[y][x] = ValueField(temp_value)
-
-    # second pass to add neighbors
-    for y, row in enumerate(game_field):
-        for x, field in enumerate(row):
-
-            # generate -1, 0 and 1
-            for i in make_range(y):
-                for j in make_range(x):
-                    # we don't have to check our own position
-                    coord_y = y + (1 * i)
-                    coord_x = x + (1 * j)
-                    if (coord_x, coord_y) != (x, y):
-                        field.neighbors.append(game_field[coord_y][coord_x])
-
-    return game_field
-
-
-class ValueField:
-    """
-    This represents a game field with a numerical value. it also serves as the base for all other classes.
-    """
-
-    def __init__(self, value: int):
-        self.value = value
-        # we only need to add it here, because all other fields inherit this property
-        self.neighbors = []
-        self.uncovered = False  # False means it's hidden, True means it's not.
-        self.flagged = False  # False means it is not flagged True means it is.
-
-    # this flags a field
-    def flag(self) -> bool:
-        if not self.uncovered:
-            self.flagged = not self.flagged
-        return True
-
-    # overwrite the __str__ function so we can easily generate the string
-    def __str__(self):
-        if self.flagged:
-            return "F"
-        elif self.uncovered:
-            return str(self.value) if self.value else "B"
 
-        else:
-            return "X"
-
-    # this uncovers a ValueField
+# cell flags of the board state
+MINE = 0x01
+REVEALED = 0x02
+FLAGGED = 0x04
 
-    def uncover(self) -> bool:
-        # have we been flagged? if no, continue, otherwise do nothing.
-        if not self.flagged:
-            self.uncovered = True
-        return True
 
-
-class ZeroField(ValueField):
+class Board(object):
     """
-    This represents a Value Fieldd with the value of 0. it also has an overwritten uncover method.
+    This is the minesweeper game state. All cells live in two flat bytearrays, one holding the flags
+    (mine, revealed, flagged) and one holding the number of neighboring mines.
+    Win and loss are tracked with counters, so no move has to scan the whole board.
     """
 
-    def __init__(self):
-        super().__init__(0)
-
-    # now we have to override this, because this does something else.
-
-    def uncover(self) -> bool:
-        # have we been flagged? if no, continue, otherwise do nothing.
-        if not self.flagged:
-            self.uncovered = True  # uncover THIS field
-            # uncover all neighbors
-            for i in self.neighbors:
-                # if this neighbour has not been uncovered, uncover it, otherwise leave it alone
-                if not i.uncovered:
-                    i.uncover()
+    __slots__ = ("width", "height", "mines", "state", "counts", "remaining", "lost", "dirty")
+
+    def __init__(self, width: int = 10, height: int = 10, mines: int = 11):
+        size = width * height
+        if not 0 < mines < size:
+            raise ValueError(f"a {width}x{height} board can't hold {mines} mines")
+
+        self.width = width
+        self.height = height
+        self.mines = mines
+        self.state = bytearray(size)
+        self.counts = bytearray(size)
+        self.lost = False
+
+        # rows that changed since they were last rendered
+        self.dirty = set(range(height))
+
+        # every safe field has to be revealed and every mine has to be flagged to win
+        self.remaining = size
+
+        # place the mines and add them to the count of all their neighbors
+        for index in random.sample(range(size), mines):
+            self.state[index] |= MINE
+            for neighbor in self.neighbors(index):
+                self.counts[neighbor] += 1
+
+    def neighbors(self, index: int):
+        """all indices around a field, without the field itself"""
+        y, x = divmod(index, self.width)
+        for ny in range(max(y - 1, 0), min(y + 2, self.height)):
+            for nx in range(max(x - 1, 0), min(x + 2, self.width)):
+                if nx != x or ny != y:
+                    yield ny * self.width + nx
+
+    @property
+    def won(self) -> bool:
+        return self.remaining == 0 and not self.lost
+
+    def flag(self, x: int, y: int) -> bool:
+        """toggle the flag on a field. always returns True, flagging can't end the game"""
+        index = y * self.width + x
+        state = self.state[index]
+
+        if not state & REVEALED:
+            self.state[index] = state ^ FLAGGED
+            self.dirty.add(y)
+
+            # only flags on mines count towards the win
+            if state & MINE:
+                self.remaining += 1 if state & FLAGGED else -1
         return True
 
+    def reveal(self, x: int, y: int) -> bool:
+        """reveal a field. returns False if it was a mine and the game is lost"""
+        index = y * self.width + x
+        state = self.state[index]
 
-class BombField(ValueField):
-    """
-    This is a Bomb field in minesweeper. The uncover function is also overwritten.
-    """
+        # flagged and revealed fields can't be revealed
+        if state & (FLAGGED | REVEALED):
+            return True
 
-    def __init__(self):
-        super().__init__(None)
-        self.triggered = False
+        if state & MINE:
+            self.state[index] = state | REVEALED
+            self.dirty.add(y)
+            self.lost = True
+            return False
 
-    def uncover(self):
-        # have we been flagged? if no, continue, otherwise do nothing.
-        if not self.flagged:
-            self.uncovered = True
-            self.triggered = True
-            return False  # game ends. no matter what
+        # reveal all connected empty fields and their borders, without recursion
+        stack = [index]
+        self.state[index] = state | REVEALED
+        self.dirty.add(y)
+        while stack:
+            index = stack.pop()
+            self.remaining -= 1
+            if self.counts[index] == 0:
+                for neighbor in self.neighbors(index):
+                    if not self.state[neighbor] & (FLAGGED | REVEALED):
+                        self.state[neighbor] |= REVEALED
+                        self.dirty.add(neighbor // self.width)
+                        stack.append(neighbor)
         return True
@@ -1,6 +1,6 @@
 import asyncio
 import discord
-import psycopg2
+import asyncpg
 
 from DemonOverlord.core.util.responses import (
     BadCommandResponse,
@@ -9,11 +9,13 @@ from DemonOverlord.core.util.responses import (
     TextResponse,
     AbortedResponse,
 )
-from DemonOverlord.core.util.logger import LogMessage, LogType, LogFormat
+from DemonOverlord.core.util.logger import LogMessage, LogType, LogFormat, log
+
+# disabling the welcome message is confirmed with a reaction
+intents = ("guild_reactions",)
 
 
 async def handler(command) -> discord.Embed:
-    cursor = command.bot.database.connection_main.cursor()
     # does user have permissions? 
     if not command.action == "show" and (not command.invoked_by.guild_permissions.administrator or not command.invoked_by.guild_permissions.manage_guild):
         res = AbortedResponse(
@@ -24,7 +26,7 @@ async def handler(command) -> discord.Embed:
 
     if command.action == "show":
         welcome = await command.bot.database.get_welcome(command.invoked_by.guild.id)
-        res = WelcomeResponse(welcome, command.bot, command.invoked_by)
+        res = await WelcomeResponse.create(welcome, command.bot, command.invoked_by)
 
     elif command.action == "enable":
         if len(command.channels) < 1:
@@ -40,21 +42,23 @@ async def handler(command) -> discord.Embed:
             res.description = f"Please make sure the bot or bot role has `Read Messages` permission in {command.channels[0].mention}"
             return res
 
-        cursor.execute(
-            "UPDATE admin.admin_core SET has_welcome='true' WHERE guild_id=%s",
-            [command.guild.id],
+        await command.bot.database.pool.execute(
+            "UPDATE admin.admin_core SET has_welcome='true' WHERE guild_id=$1",
+            command.guild.id,
         )
         try:
-            cursor.execute(
-                "INSERT INTO admin.welcome_messages (guild_id, welcome_channel) VALUES (%s, %s)",
-                [command.guild.id, command.channels[0].id],
+            await command.bot.database.pool.execute(
+                "INSERT INTO admin.welcome_messages (guild_id, welcome_channel) VALUES ($1, $2)",
+                command.guild.id,
+                command.channels[0].id,
             )
-        except psycopg2.IntegrityError:
-            print(
+        except asyncpg.IntegrityConstraintViolationError:
+            log(
                 LogMessage(
                     f"Entry for guild '{command.guild.name}' already exists, skipping insertion"
                 )
             )
+        command.bot.database.invalidate_settings(command.guild.id)
 
         res = ConfirmedResponse("Welcome Message", "enabled")
         res.description = (
@@ -64,18 +68,13 @@ async def handler(command) -> discord.Embed:
     elif command.action == "disable":
 
         def check_msg(reaction, user):
-            print(reaction)
-            return (
-                user == command.invoked_by
-                and str(reaction.emoji) in command.bot.config.emoji["yes_no"]
-            )
+            return str(reaction.emoji) in command.bot.config.emoji["yes_no"]
 
         res = None
-        cursor.execute(
-            "SELECT guild_id FROM admin.welcome_messages WHERE guild_id=%s",
-            [command.guild.id],
+        result = await command.bot.database.pool.fetchrow(
+            "SELECT guild_id FROM admin.welcome_messages WHERE guild_id=$1",
+            command.guild.id,
         )
-        result = cursor.fetchone()
         if result == None:
             res = AbortedResponse(
                 "Deleting the Welcome Message", "Welcome message is not enabled"
@@ -94,9 +93,11 @@ async def handler(command) -> discord.Embed:
         await message.add_reaction(command.bot.config.emoji["yes_no"][1])
 
         try:
-            reaction, user = await command.bot.wait_for(
-                "reaction_add", timeout=60, check=check_msg
-            )
+            # only reactions of the invoking user to this prompt are routed to the session
+            with command.bot.sessions.open(
+                command.channel.id, command.invoked_by.id, message_id=message.id, check=check_msg
+            ) as session:
+                reaction, user = await session.wait(timeout=60)
         except asyncio.TimeoutError:
             return AbortedResponse(
                 "Deleting the Welcome Message", "The prompt timed out after 60 seconds"
@@ -104,21 +105,22 @@ async def handler(command) -> discord.Embed:
 
         if str(reaction.emoji) == command.bot.config.emoji["yes_no"][0]:
 
-            cursor.execute(
-                "UPDATE admin.admin_core SET has_welcome='false' WHERE guild_id=%s",
-                [command.guild.id],
+            await command.bot.database.pool.execute(
+                "UPDATE admin.admin_core SET has_welcome='false' WHERE guild_id=$1",
+                command.guild.id,
             )
             try:
-                cursor.execute(
-                    "DELETE FROM admin.welcome_messages WHERE guild_id=%s",
-                    [command.guild.id],
+                await command.bot.database.pool.execute(
+                    "DELETE FROM admin.welcome_messages WHERE guild_id=$1",
+                    command.guild.id,
                 )
+                command.bot.database.invalidate_settings(command.guild.id)
                 res = ConfirmedResponse("Welcome Message", "disabled")
                 res.description = (
                     f"The welcome message was removed and all data was deleted"
                 )
-            except psycopg2.Error:
-                print(
+            except asyncpg.PostgresError:
+                log(
                     LogMessage(
                         f"Entry for guild '{command.guild.name}' doesn't exist exists, skipping deletion"
                     )
@@ -131,5 +133,4 @@ async def handler(command) -> discord.Embed:
 
     else:
         res = BadCommandResponse(command)
-    cursor.close()
     return res
@@ -1,7 +1,12 @@
 # imports
-from DemonOverlord.core.util.logger import LogMessage, LogType
+from DemonOverlord.core.util.cache import LRUCache, MISSING
+from DemonOverlord.core.util.logger import LogMessage, LogType, log
+from DemonOverlord.core.util.metrics import metrics
 import aiohttp
+import ijson
 import random
+import asyncio
+import time
 from random import randint
 
 
@@ -15,35 +20,88 @@ class API:
         self.name = name
         self.url = url
 
+        # the shared, pooled aiohttp session. it is owned and set by APIConfig
+        self.session = None
+
+
+
+class TenorPool(object):
+    """
+    This holds the fetched GIF urls for a single Tenor query, along with the pagination position for the next refill.
+    """
+
+    def __init__(self, query: str):
+        self.query = query
+        self.urls = []
+        self.pos = None
+        self.expires = 0
+        self.refill = None
 
 
 class TenorAPI(API):
     """
     This is the Tenor API class, used to interact with Tenor, the GIF service.
+    Results are kept in a pool per query and served from memory. Pools are refilled in the background when they run low.
     """
 
-    def __init__(self, apikey: str):
+    def __init__(self, apikey: str, batch_size: int = 50, low_water: int = 10, ttl: int = 3600):
 
         # initialize super class
         super().__init__(apikey, "tenor", "https://api.tenor.com/v1/search")
 
+        self.batch_size = batch_size
+        self.low_water = low_water
+        self.ttl = ttl
+        self.pools = {}
+
     async def get_interact(self, name: str) -> str:
+        pool = self.pools.get(name)
+        if pool is None:
+            pool = self.pools[name] = TenorPool(name)
+
+        # stale urls may not work anymore, start over
+        if pool.expires < time.monotonic() and not (pool.refill and not pool.refill.done()):
+            pool.urls.clear()
+            pool.pos = None
+
+        # nothing to serve, we have to wait for Tenor
+        if len(pool.urls) == 0:
+            await self._schedule_refill(pool)
+            if len(pool.urls) == 0:
+                return False
+
+        # every url is only served once, the pool is refilled with the next page of results
+        result = pool.urls.pop(random.randrange(len(pool.urls)))
+        if len(pool.urls) < self.low_water:
+            self._schedule_refill(pool)
+
+        return result
+
+    def _schedule_refill(self, pool: TenorPool) -> asyncio.Future:
+        """start a refill of the pool, unless one is already running"""
+        if pool.refill is None or pool.refill.done():
+            pool.refill = asyncio.ensure_future(self._refill(pool))
+        return asyncio.shield(pool.refill)
+
+    async def _refill(self, pool: TenorPool) -> None:
+        """get the next page of results for the pool's query"""
         try:
-            url = f'{self.url}?q={name.replace(" ", "+")}&key={self.apikey}&limit=20'
-            async with aiohttp.ClientSession() as session:
-                async with await session.get(url) as response:
-                    assert response.status == 200
-                    data = await response.json()
-                    res_list = list(data["results"])
-
-        except Exception:
-            return False
-        else:
-            result = random.choice(res_list)["media"][0]["gif"]["url"]
-            return result
+            url = f'{self.url}?q={pool.query.replace(" ", "+")}&key={self.apikey}&limit={self.batch_size}'
+            if pool.pos:
+                url += f"&pos={pool.pos}"
 
-        
+            async with self.session.get(url) as response:
+                assert response.status == 200
+                data = await response.json()
 
+            if pool.pos is None:
+                pool.expires = time.monotonic() + self.ttl
+            pool.urls.extend(result["media"][0]["gif"]["url"] for result in data["results"])
+
+            # Tenor returns an empty or "0" position once we reach the end, then we start from the front
+            pool.pos = data.get("next") if data.get("next") not in ("", "0") else None
+        except Exception as e:
+            log(LogMessage(f"Refilling Tenor results for '{pool.query}' failed: {type(e).__name__}", msg_type=LogType.ERROR))
 
 
 class InspirobotAPI(API):
@@ -61,10 +119,9 @@ class InspirobotAPI(API):
         try:
             # you know... i don't like that you treat me like an object...
             res = None
-            async with aiohttp.ClientSession() as session:
-                async with await session.get(f"{self.url}/api?generate=true") as response:
-                    assert response.status == 200
-                    res = await response.text()
+            async with self.session.get(f"{self.url}/api?generate=true") as response:
+                assert response.status == 200
+                res = await response.text()
                 
             return res
         except Exception as e:
@@ -73,32 +130,45 @@ class InspirobotAPI(API):
 
 
 class SteamAPI(API):
-    def __init__(self):
+    def __init__(self, read_timeout: float = 60):
         super().__init__("", "Steam", "https://api.steampowered.com/ISteamApps/GetAppList/v2/")
+
+        # the applist is streamed for as long as the database takes, only a stalled read is a timeout
+        self.read_timeout = read_timeout
+
+        # recent lookups by normalized game name, games that aren't on steam are cached as None
+        self.games = LRUCache(maxsize=2048, ttl=3600*6)
     
-    async def get_appdata(self) -> dict:
-        try:
-            print(LogMessage(f"Trying to get steam appdata from '{self.url}'") )
-            async with aiohttp.ClientSession() as session:
-                async with await session.get(self.url) as response:
-                    assert response.status == 200
-                    return await response.json()
-        except AssertionError:
-            print(LogMessage(f"Getting steam appdata failed.")) 
+    async def iter_appdata(self):
+        """
+        Stream the applist and yield `(appid, name)` tuples while it is still downloading.
+        The response is parsed incrementally, so the full catalog never has to be in memory at once.
+        """
+        log(LogMessage(f"Trying to stream steam appdata from '{self.url}'") )
+        timeout = aiohttp.ClientTimeout(total=None, sock_read=self.read_timeout)
+        async with self.session.get(self.url, timeout=timeout) as response:
+            assert response.status == 200
+            async for app in ijson.items(response.content, "applist.apps.item"):
+                yield app["appid"], app["name"]
 
     async def get_gamedata(self, bot, game:str) -> dict:
         try:
 
             for i in ["Options", "Steam"]:
                 game = game.upper().replace(i.upper(), "")
-
-            with bot.database.connection_main.cursor() as cursor:
-                cursor.execute("SELECT store_url, image_url FROM public.steam_data WHERE UPPER(game_name) = %s ORDER BY appid ASC", [f"{game.strip()}"])
-                results = cursor.fetchall()
-                if len(results) == 0:
-                    return None
-                else:
-                    return results[0]
+            game = game.strip()
+
+            # popular games are requested over and over again
+            result = self.games.get(game)
+            if result is not MISSING:
+                return result
+
+            # game_name_normalized is UPPER(game_name) and indexed, see db_template.json
+            with metrics.time("database_query_seconds", query="get_gamedata"):
+                result = await bot.database.pool.fetchrow("SELECT store_url, image_url FROM public.steam_data WHERE game_name_normalized = $1 ORDER BY appid ASC LIMIT 1", game)
+            result = dict(result) if result else None
+            self.games.set(game, result)
+            return result
         except Exception as e:
-            print(LogMessage("something went wrong when requesting Game data", msg_type=LogType.ERROR))
-            print(LogMessage(e, msg_type=LogType.ERROR))
+            log(LogMessage("something went wrong when requesting Game data", msg_type=LogType.ERROR))
+            log(LogMessage(e, msg_type=LogType.ERROR))
@@ -0,0 +1,56 @@
+import time
+from collections import OrderedDict
+
+
+# marker for cache misses, so None can be cached as a valid (negative) result
+MISSING = object()
+
+
+class LRUCache(object):
+    """
+    This is a small least recently used cache with an optional time to live for all entries.
+    Once `maxsize` is reached, the entry that was used the longest time ago is evicted.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+
+    def get(self, key, default=MISSING):
+        """get an entry and mark it as recently used, returns `default` if it is missing or expired"""
+        try:
+            expires, value = self._data[key]
+        except KeyError:
+            return default
+
+        # expired entries are treated as missing
+        if expires is not None and expires < time.monotonic():
+            del self._data[key]
+            return default
+
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value) -> None:
+        """add or replace an entry, evicting the least recently used one if the cache is full"""
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        self._data[key] = (expires, value)
+        self._data.move_to_end(key)
+
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key) -> None:
+        """remove a single entry, if it exists"""
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        """remove all entries"""
+        self._data.clear()
+
+    def __contains__(self, key) -> bool:
+        return self.get(key) is not MISSING
+
+    def __len__(self) -> int:
+        return len(self._data)
@@ -0,0 +1,68 @@
+class InteractionEntry(object):
+    """
+    This is a single interaction from interactions.json, compiled for the handler. Everything an interaction embed
+    needs is precomputed: the gifs as a tuple, the emoji as text and how much room the title has left for mentions.
+    """
+
+    __slots__ = (
+        "name",
+        "kind",
+        "type",
+        "query",
+        "gifs",
+        "emoji",
+        "verb",
+        "verb_social",
+        "violent",
+        "self_texts",
+        "title_budget",
+    )
+
+    # discord allows 256 characters in a title, we keep a small margin
+    TITLE_LIMIT = 253
+
+    def __init__(self, name: str, kind: str, info: dict, emoji: str):
+        self.name = name
+        self.kind = kind
+        self.type = info.get("type")
+        self.query = info["query"]
+        self.gifs = tuple(info["gifs"] or ())
+        self.emoji = emoji
+        self.violent = info.get("violent", False)
+        self.self_texts = tuple(info.get("self") or ())
+
+        # combine interactions have a verb for each case, the others only one
+        if kind == "combine":
+            self.verb = info["action"]["alone"]
+            self.verb_social = info["action"]["social"]
+        else:
+            self.verb = self.verb_social = info["action"]
+
+        # the title is "<user> <verb> <mentions>", the user's name and the mentions are added per command
+        self.title_budget = self.TITLE_LIMIT - 3 - len(self.verb_social) - len(self.emoji)
+
+
+class InteractionCatalog(object):
+    """
+    This is the compiled interactions.json, one InteractionEntry per action, so a message is identified as an
+    interaction and its entry found with a single lookup. It needs the izzymojis, see DemonOverlord.on_ready.
+    """
+
+    def __init__(self, interactions: dict, izzymojis: dict):
+        self.entries = dict()
+        for kind in ("alone", "social", "combine"):
+            for name, info in interactions[kind].items():
+                # an action in more than one category is handled as the first one
+                if name in self.entries:
+                    continue
+                emoji = izzymojis.get(info["emoji"])
+                self.entries[name] = InteractionEntry(name, kind, info, str(emoji) if emoji is not None else "")
+
+    def get(self, name: str):
+        return self.entries.get(name)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.entries
+
+    def __len__(self) -> int:
+        return len(self.entries)
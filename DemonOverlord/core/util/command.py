@@ -13,9 +13,43 @@ from DemonOverlord.core.util.responses import (
     BadCommandResponse,
     MissingPermissionResponse,
 )
-from DemonOverlord.core.util.logger import ( LogType, LogMessage)
+from DemonOverlord.core.util.logger import ( LogType, LogMessage, log)
+from DemonOverlord.core.util.metrics import metrics
 
 
+class CommandRegistry(object):
+    """
+    This maps command names and interaction actions to their handlers. It is built once at startup, so parsing
+    a message is a dict lookup instead of scanning and importing the modules package every time.
+
+    Every module in `DemonOverlord.core.modules` with a `handler` coroutine is registered under its module name.
+    Modules that need gateway intents beyond the bot's intent profile list them in a module level `intents` tuple.
+    Intents a module can do without go in `optional_intents`, those are only enabled if the profile allows them.
+    """
+
+    def __init__(self, commands):
+        self.handlers = dict()
+        self.actions = dict()
+        self.intents = set()
+        self.optional_intents = set()
+
+        # import all the submodules, once
+        for importer, modname, ispkg in pkgutil.iter_modules(cmds.__path__):
+            module = import_module("." + modname, "DemonOverlord.core.modules")
+            if hasattr(module, "handler"):
+                self.handlers[modname] = module.handler
+            self.intents.update(getattr(module, "intents", ()))
+            self.optional_intents.update(getattr(module, "optional_intents", ()))
+
+        self.update_actions(commands)
+
+    def update_actions(self, commands) -> None:
+        """collect the known actions of every command from cmd_info.json"""
+        actions = dict()
+        for command in commands.list:
+            actions[command["command"]] = {action["action"] for action in command.get("actions") or []}
+        self.actions = actions
+
 
 class Command(object):
     def __init__(self, bot: discord.Client, message: discord.message):
@@ -25,8 +59,12 @@ class Command(object):
         self.mentions = message.mentions
         self.channels = message.channel_mentions
         self.guild = message.guild
+        self.command = None
         self.action = None
         self.bot = bot
+
+        # the command config this command runs with, a reload during execution doesn't change it
+        self.commands = bot.commands
         self.channel = message.channel
         self.full = message.content.replace("\n", " ")
         self.special = None
@@ -34,6 +72,7 @@ class Command(object):
         self.short = False
         self.params = None
         self.reference = None
+        self.interaction = None
 
         # create the command
         to_filter = ["", " ", None]
@@ -52,20 +91,13 @@ class Command(object):
             self.command = None
             return
 
-        if self.command in bot.commands.short:
+        if self.command in self.commands.short:
             self.short = True
 
-        # Import all the submodules
-        for importer, modname, ispkg in pkgutil.iter_modules(cmds.__path__):
-            import_module("." + modname, "DemonOverlord.core.modules")
-
         # is it a special case??
         # WE DO
-        if (
-            temp[1] in bot.commands.interactions["alone"]
-            or temp[1] in bot.commands.interactions["social"]
-            or temp[1] in bot.commands.interactions["combine"]
-        ):
+        self.interaction = self.commands.catalog.get(temp[1])
+        if self.interaction is not None:
             self.reference = message.reference
 
             if self.reference != None:
@@ -73,7 +105,7 @@ class Command(object):
             
             self.command = "interactions"
             self.action = temp[1]
-            self.special = bot.commands.interactions
+            self.special = self.commands.interactions
             self.params = temp[2:] if len(temp) > 2 else None
 
 
@@ -87,37 +119,66 @@ class Command(object):
             self.action = temp[2] if len(temp) > 2 else None
             self.params = temp[2:] if len(temp) > 3 else None
 
+    @property
+    def labels(self) -> dict:
+        """
+        the metric labels of this command. unknown commands and actions are grouped,
+        so user input can't create new metric series
+        """
+        registry = self.bot.registry
+        command = self.command if self.command in registry.handlers else "unknown"
+
+        if self.action is None:
+            action = "none"
+        elif command == "interactions" or self.action in registry.actions.get(command, ()):
+            action = self.action
+        else:
+            action = "other"
+
+        return {"command": command, "action": action}
+
     async def exec(self) -> None:
         # try catch for generic error
+        labels = self.labels
 
         try:
-            if (self.command in dir(cmds)) and (not self.short):
+            handler = self.bot.registry.handlers.get(self.command)
+            if handler and (not self.short):
                 # see if limiter is active, if not, execute the command
-                # limiter removed temporarily. 
-                if not False:
-                    response = await getattr(cmds, self.command).handler(self)
+                remaining = self.bot.limiter.check(self)
+                if remaining == 0:
+                    with metrics.time("command_exec_seconds", **labels):
+                        response = await handler(self)
+                    result = "ok"
                 else:
                     # rate limit error
-                    response = RateLimitResponse(self, limit["timeRemain"])
+                    response = RateLimitResponse(self, int(remaining) + 1)
+                    result = "ratelimited"
             elif self.short:
                 return  # shorthand commands are handled by their respective module. e.g. minesweeper
 
             else:
                 response = BadCommandResponse(self)
                 self.reference = None
+                result = "unknown"
         except discord.Forbidden:
-            print(LogMessage(f"No permission to run {self.command}", msg_type=LogType.ERROR))
+            log(LogMessage(f"No permission to run {self.command}", msg_type=LogType.ERROR))
             response = MissingPermissionResponse(self, traceback.format_exc())
             self.reference = None
+            result = "forbidden"
         except Exception:
             response = ErrorResponse(self, traceback.format_exc())
             self.reference = None
+            result = "error"
+        metrics.inc("commands_total", result=result, **labels)
  
         # Send the message
-        message = await self.channel.send(embed=response, reference=self.reference)
+        with metrics.time("discord_request_seconds", request="send"):
+            message = await self.channel.send(embed=response, reference=self.reference)
 
         # remove error messages and messages with timeout
         if isinstance(response, (TextResponse)):
             if response.timeout > 0:
                 await message.delete(delay=response.timeout)
-        await self.message.delete()
+        with metrics.time("discord_request_seconds", request="delete"):
+            await self.message.delete()
@@ -7,11 +7,19 @@ import discord
 import os
 import ujson as json
 import asyncio
-import psycopg2, psycopg2.extras, psycopg2.extensions
+import asyncpg
+import contextlib
+import hashlib
+import aiohttp
 
 
 from DemonOverlord.core.util.api import TenorAPI, InspirobotAPI, SteamAPI
-from DemonOverlord.core.util.logger import LogMessage, LogType
+from DemonOverlord.core.util.cache import LRUCache, MISSING
+from DemonOverlord.core.util.catalog import InteractionCatalog
+from DemonOverlord.core.util.responses import ResponseCache
+from DemonOverlord.core.util.logger import LogMessage, LogType, log, logger
+from DemonOverlord.core.util.metrics import metrics
+from DemonOverlord.core.util import snapshot
 
 class BotConfig(object):
     """
@@ -22,24 +30,26 @@ class BotConfig(object):
         # set all vars None first, this also gives us a list of all currently available vars
         self.raw = None
         self.mode = None
+        self.shards = None
         self.izzymojis = dict()
         self.token = None
         self.env = None
         self.emoji = None
         self.status_messages = list()
 
-        # get the raw config.json
-        with open(os.path.join(confdir, "config.json")) as f:
-            self.raw = json.load(f)
+        # get the raw config.json, from the validated config snapshot
+        config = snapshot.load(confdir)
+        self.raw = config["config"]
 
         # create config from cli stuff
-        for arg in argv:
+        self.mode, self.shards = self.parse_argv(self.raw, argv)
 
-            # set bot mode
-            if arg in self.raw["cli_options"]["bot_modes"]:
-                self.mode = self.raw["cli_options"]["bot_modes"][argv[1]]
-            else:
-                self.mode = self.raw["cli_options"]["bot_modes"]["--dev"]
+        # production logs are written as json lines, development logs are formatted for the terminal
+        logger.configure(
+            self.raw["logging"]["level"],
+            self.mode["log_format"],
+            self.raw["logging"]["sampling"],
+        )
 
         # all usable activity types
         status_types = {
@@ -51,20 +61,9 @@ class BotConfig(object):
         }
 
         # go through status messages and add them to the list of possible messages
-        for message in self.raw["status_messages"]:
-
+        for activity in config["activities"]:
             self.status_messages.append(
-                discord.Activity(
-                    name=message["content"],
-                    type=status_types[message["type"]],
-
-                    # the url is a special case, as a joking promo for vecter
-                    url=(
-                        "https://www.youtube.com/watch?v=dBRSjTKdtrI"
-                        if "Vecter" in message["content"]
-                        else None
-                    ),
-                )
+                discord.Activity(name=activity["name"], type=status_types[activity["type"]], url=activity["url"])
             )
 
         # set the token
@@ -72,6 +71,71 @@ class BotConfig(object):
         self.token = os.environ[self.env["discord"][f"{self.mode['name']}_token"]]
         self.emoji = self.raw["emoji"]
 
+    @staticmethod
+    def parse_argv(raw: dict, argv: list) -> tuple:
+        """get the bot mode and the shard layout from the command line. the defaults are --dev and --unsharded"""
+        options = raw["cli_options"]
+        mode = options["bot_modes"]["--dev"]
+        layout = options["shard_layouts"]["--unsharded"]
+
+        for arg in argv[1:]:
+            if arg in options["bot_modes"]:
+                mode = options["bot_modes"][arg]
+            elif arg in options["shard_layouts"]:
+                layout = options["shard_layouts"][arg]
+        return mode, layout
+
+    @staticmethod
+    def shard_groups(layout: dict) -> list:
+        """
+        split the shards of a layout into one list of shard ids per process.
+        if discord recommends the shard count, there is only one process and its group is None (all shards)
+        """
+        count = layout["shard_count"]
+        processes = layout["processes"]
+
+        if count is None:
+            if processes > 1:
+                raise ValueError(f"shard layout '{layout['name']}' runs {processes} processes, it needs a shard_count")
+            return [None]
+        elif processes > count:
+            raise ValueError(f"shard layout '{layout['name']}' has more processes than shards")
+
+        shards = list(range(count))
+        return [shards[i * count // processes : (i + 1) * count // processes] for i in range(processes)]
+
+    def client_options(self, module_intents: set = (), optional_intents: set = ()) -> dict:
+        """
+        the intents and member cache settings of the bot mode's intent profile, as keyword arguments for discord.Client.
+        the "full" profile enables everything, others only enable their own intents, the ones modules need and the
+        optional ones of modules the profile allows in `optional_intents`
+        """
+        profile = self.raw["intent_profiles"][self.mode["intent_profile"]]
+
+        if profile["intents"] is None:
+            intents = discord.Intents.all()
+        else:
+            intents = discord.Intents.none()
+            allowed = set(optional_intents) & set(profile["optional_intents"] or ())
+            for name in list(profile["intents"]) + list(module_intents) + sorted(allowed):
+                setattr(intents, name, True)
+
+        if profile["member_cache"] is None:
+            member_cache = discord.MemberCacheFlags.from_intents(intents)
+        else:
+            member_cache = discord.MemberCacheFlags.none()
+            for name in profile["member_cache"]:
+                setattr(member_cache, name, True)
+
+            # only the profile decides what is cached, online members can only be cached with presences
+            member_cache.online = member_cache.online and intents.presences
+
+        return {
+            "intents": intents,
+            "member_cache_flags": member_cache,
+            "chunk_guilds_at_startup": profile["chunk_guilds_at_startup"],
+        }
+
     def post_connect(self, bot: discord.Client):
         """this function loads any configuration that needs the bot to be online (like emoji)"""
 
@@ -82,28 +146,76 @@ class BotConfig(object):
 
 class APIConfig(object):
     """
-    This is the API config class, it combines and initializes the APIs into a single point
+    This is the API config class, it combines and initializes the APIs into a single point.
+    It also owns the one long lived, pooled HTTP session that all APIs share.
     """
 
     def __init__(self, config: BotConfig):
         # var init
         self.tenor = None
         self.inspirobot = InspirobotAPI()
-        self.steam = SteamAPI()
+        self.session = None
+
+        # connection pool settings, see the api section in config.json
+        self.pool_config = config.raw["api"]["connection_pool"]
+        self.steam = SteamAPI(read_timeout=self.pool_config["stream_read_timeout"])
 
         tenor_key = os.environ.get(config.env["tenor"]["token"])
         if tenor_key:
-            self.tenor = TenorAPI(tenor_key)
+            self.tenor = TenorAPI(tenor_key, **config.raw["api"]["tenor"])
+
+    async def connect(self) -> None:
+        """create the shared session and hand it to all APIs. this has to run on the bot's loop"""
+        connector = aiohttp.TCPConnector(
+            limit=self.pool_config["limit"],
+            limit_per_host=self.pool_config["limit_per_host"],
+            ttl_dns_cache=self.pool_config["dns_cache_ttl"],
+            keepalive_timeout=self.pool_config["keepalive_timeout"],
+        )
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.pool_config["timeout"]),
+            trace_configs=[self._trace_config()],
+        )
+
+        for api in (self.tenor, self.inspirobot, self.steam):
+            if api:
+                api.session = self.session
+
+    @staticmethod
+    def _trace_config() -> aiohttp.TraceConfig:
+        """record the latency of every outbound api request, labeled by host and status"""
+
+        async def on_request_start(session, context, params):
+            context.start = time.perf_counter()
+
+        async def on_request_end(session, context, params):
+            metrics.observe(
+                "api_request_seconds",
+                time.perf_counter() - context.start,
+                host=params.url.host,
+                status=params.response.status,
+            )
+
+        async def on_request_exception(session, context, params):
+            metrics.inc("api_request_errors_total", host=params.url.host, error=type(params.exception).__name__)
+
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_start.append(on_request_start)
+        trace_config.on_request_end.append(on_request_end)
+        trace_config.on_request_exception.append(on_request_exception)
+        return trace_config
 
     async def close_connections(self):
-        await self.tenor.close() if self.tenor else None
-        await self.steam.close()
-        await self.inspirobot.close()
+        """close the shared session and all pooled connections"""
+        if self.session and not self.session.closed:
+            await self.session.close()
 
 
 class DatabaseConfig(object):
     """
     This class handles all Database integrations and connections as well as setup and testing the database.
+    All queries run on an asyncpg connection pool, so they never block the event loop and can run concurrently.
     """
 
     def __init__(self, bot: discord.Client, confdir):
@@ -114,192 +226,298 @@ class DatabaseConfig(object):
         self.db_addr = os.environ[bot.config.env["postgres"]["host"]]
         self.db_port = os.environ[bot.config.env["postgres"]["port"]]
         self.main_db = os.environ[bot.config.env["postgres"]["db"]]
-        self.connection = None
+        self.pool = None
         self.tables_scanned = asyncio.Event()
-        self.settings = {}
 
-        # load database templates
-        with open(os.path.join(confdir, "db_template.json")) as file:
-            db_template = json.load(file)
+        # pool sizing, see the database section in config.json. the connections are split between all processes
+        self.pool_config = dict(bot.config.raw["database"]["pool"])
+        processes = bot.config.shards["processes"]
+        self.pool_config["max_size"] = max(self.pool_config["max_size"] // processes, 2)
+        self.pool_config["min_size"] = min(self.pool_config["min_size"], self.pool_config["max_size"])
+
+        # per guild settings (welcome messages, autoroles), keyed by (setting, guild_id)
+        self.settings = LRUCache(
+            maxsize=bot.config.raw["database"]["settings_cache"]["max_size"],
+            ttl=bot.config.raw["database"]["settings_cache"]["ttl"],
+        )
+
+        # load database templates, the hash tells us if the template changed since the last verification
+        with open(os.path.join(confdir, "db_template.json"), "rb") as file:
+            raw_template = file.read()
+        db_template = json.loads(raw_template)
+        self.template_hash = hashlib.sha256(raw_template).hexdigest()
+        self.catalog_hash = None
+        self.schema_cache = os.path.join(confdir, ".schema_cache.json")
 
         self.tables = db_template["tables"]
         self.tables_to_fix = []
         self.necessary_tables = list(filter(lambda x : x["entry_required"], self.tables))
+        self.guild_tables = list(filter(lambda x : any(c["column_name"] == "guild_id" for c in x["columns"]), self.tables))
 
         # mark all schemata as missing by default
         self.schemata = {}
         for i in db_template["schemata"]:
             self.schemata.update({i: False})
 
-        # create maintenance connection
-        self.connection_maintenance = psycopg2.connect(
-            user=self.db_user,
-            password=self.db_pass,
-            host=self.db_addr,
-            port=self.db_port,
-            database="postgres",
-            cursor_factory=psycopg2.extras.RealDictCursor,
-        )
-        self.connection_maintenance.set_session(autocommit=True)
+    async def connect(self) -> None:
+        """
+        Create the connection pool for the main database. If the database does not exist, we try to create it
+        through a short lived maintenance connection. We try this 5 times and give up after.
+        """
 
-        # try to connect to the main database 5 times and give up after
-        success = False
         n = 5
-        while not success and n > 1:
+        while self.pool is None and n > 1:
             try:
-                # try creating a connection
-                self.connection_main = psycopg2.connect(
+                # try creating the pool
+                self.pool = await asyncpg.create_pool(
                     user=self.db_user,
                     password=self.db_pass,
                     host=self.db_addr,
                     port=self.db_port,
                     database=self.main_db,
-                    cursor_factory=psycopg2.extras.RealDictCursor,
+                    min_size=self.pool_config["min_size"],
+                    max_size=self.pool_config["max_size"],
+                    max_inactive_connection_lifetime=self.pool_config["max_inactive_lifetime"],
+                    command_timeout=self.pool_config["command_timeout"],
                 )
-                self.connection_main.set_session(autocommit=True)
-                success = True
-            except Exception:
+            except asyncpg.InvalidCatalogNameError:
                 # if it fails, we try creating it
-                try:
-                    print(
-                        LogMessage(
-                            f"Database {self.main_db} does not exist, trying to create",
-                            msg_type=LogType.ERROR,
-                            time=False,
-                        )
-                    )
-                    cursor = self.connection_maintenance.cursor()
-                    cursor.execute(
-                        f"CREATE DATABASE \"{self.main_db}\" WITH OWNER = bot ENCODING = 'UTF8' LC_COLLATE = 'en_US.utf8' LC_CTYPE = 'en_US.utf8' TABLESPACE = pg_default CONNECTION LIMIT = -1;"
-                    )
-                except Exception:
-                    # and we log our failure
-                    print(
-                        LogMessage(
-                            f"Failed to create database",
-                            msg_type=LogType.ERROR,
-                            time=False,
-                        )
+                log(
+                    LogMessage(
+                        f"Database {self.main_db} does not exist, trying to create",
+                        msg_type=LogType.ERROR,
+                        time=False,
                     )
-                else:
-                    print(LogMessage(f"Database successfully created", time=False))
+                )
+                await self._create_database()
             n -= 1
-        if not success:
-            print(
+
+        if self.pool is None:
+            raise ConnectionError(f"Failed to connect to database '{self.main_db}' after 5 tries")
+
+    async def close(self) -> None:
+        """Gracefully close all connections in the pool"""
+        if self.pool is not None:
+            await self.pool.close()
+
+    async def _create_database(self) -> None:
+        """create the main database through the maintenance database"""
+        try:
+            connection = await asyncpg.connect(
+                user=self.db_user,
+                password=self.db_pass,
+                host=self.db_addr,
+                port=self.db_port,
+                database="postgres",
+            )
+            try:
+                await connection.execute(
+                    f"CREATE DATABASE \"{self.main_db}\" WITH OWNER = bot ENCODING = 'UTF8' LC_COLLATE = 'en_US.utf8' LC_CTYPE = 'en_US.utf8' TABLESPACE = pg_default CONNECTION LIMIT = -1;"
+                )
+            finally:
+                await connection.close()
+        except Exception:
+            # and we log our failure
+            log(
                 LogMessage(
-                    f"Failed to create database after 5 tries",
+                    f"Failed to create database",
                     msg_type=LogType.ERROR,
                     time=False,
                 )
             )
+        else:
+            log(LogMessage(f"Database successfully created", time=False))
 
+    @metrics.timed("database_query_seconds", query="table_test")
     async def table_test(self) -> bool:
         """
-        Test if all tables exist and are set up properly, otherwise add them to the `self.tables_to_fix` list with tag
+        Test if all tables exist and are set up properly, otherwise add them to the `self.tables_to_fix` list with tag.
+        The whole catalog of the configured schemata is fetched with two queries and compared in memory.
         """
-
-        # create out infanmous cursor
-        cursor = self.connection_main.cursor()
+        schemata = list(self.schemata)
+
+        async with self.pool.acquire() as connection:
+
+            # all tables and their columns. tables without columns have a single row with NULL columns
+            result = await connection.fetch(
+                """
+                SELECT t.table_schema::text, t.table_name::text, c.column_name::text, c.column_default::text,
+                    c.data_type::text, c.is_nullable::text, c.character_maximum_length::integer
+                FROM information_schema.tables t
+                LEFT JOIN information_schema.columns c ON c.table_schema = t.table_schema AND c.table_name = t.table_name
+                WHERE t.table_schema = ANY($1::text[]);
+                """,
+                schemata,
+            )
+            tables = dict()
+            for row in result:
+                columns = tables.setdefault((row["table_schema"], row["table_name"]), dict())
+                if row["column_name"] is not None:
+                    columns[row["column_name"]] = row
+
+            # all primary keys and indexes
+            result = await connection.fetch(
+                """
+                SELECT tc.table_schema::text, tc.table_name::text, tc.constraint_name::text AS name, kcu.column_name::text
+                FROM information_schema.table_constraints tc
+                JOIN information_schema.key_column_usage kcu ON kcu.constraint_schema = tc.constraint_schema AND kcu.constraint_name = tc.constraint_name
+                WHERE tc.constraint_type = 'PRIMARY KEY' AND tc.table_schema = ANY($1::text[])
+                UNION ALL
+                SELECT schemaname::text, tablename::text, indexname::text, NULL
+                FROM pg_indexes
+                WHERE schemaname = ANY($1::text[]);
+                """,
+                schemata,
+            )
+            pkeys = set((row["table_schema"], row["name"], row["column_name"]) for row in result if row["column_name"])
+            indexes = set((row["table_schema"], row["name"]) for row in result if not row["column_name"])
 
         # walk through all tables and check them 
         for table in self.tables:
+            columns = tables.get((table["table_schema"], table["table_name"]))
 
             # test if tables exist
-            cursor.execute(
-                "SELECT table_name, table_schema FROM information_schema.tables WHERE table_name=%s;",
-                [table["table_name"]],
-            )
-            result = cursor.fetchall()
-
-            if len(result) == 0:
+            if columns is None:
                 self.tables_to_fix.append((table, "MISSING"))
                 continue
 
             # test if the table has columns at all
-            cursor.execute(
-                "SELECT column_name, column_default, data_type, is_nullable, character_maximum_length FROM information_schema.columns WHERE table_name=%s;",
-                [table["table_name"]],
-            )
-            result = cursor.fetchall()
-
-            if len(result) == 0:
+            if len(columns) == 0:
                 self.tables_to_fix.append((table, "MISSING_COLS"))
                 continue
 
             # test if columns exist and are set up correctly
             for column in table["columns"]:
-                row = list(
-                    filter(lambda x: x["column_name"] == column["column_name"], result)
-                )
+                row = columns.get(column["column_name"])
 
-                if len(row) == 0:
+                if row is None:
                     self.tables_to_fix.append((table, "MISSING_COL", column))
                     continue
 
-                # scan through columns and see if all are set up correctly
-                for key in column:
-
-                    # this key is unimportant for the database, and i don't know how to test for it
-                    if key == "auto_increment":
-                        continue
-
-                    # yay, we arrived at nullable, now we have to handle the YES and NO
-                    if key == "is_nullable":
-                        nullable = "YES" if column[key] else "NO"
-                        if not nullable == row[0][key]:
-                            self.tables_to_fix.append((table, "WRONG_SETUP", column))
-                        continue
-
-                    # this part handles boolean types and type comparison to Python bool
-                    if row[0]["data_type"] == "boolean" and key == "column_default" and not column["is_nullable"]:
-                        if not column[key] == eval((str(row[0][key]).lower()).capitalize()):
-                            self.tables_to_fix.append((table, "WRONG_SETUP", column))
-
-                        continue
-
-                    # The part that handles if the default_column being a string
-                    if (
-                        row[0]["data_type"] == "character varying"
-                        and key == "column_default"
-                    ):
-                        if not str(
-                            row[0][key]
-                        ) == f"'{column[key]}'::character varying" and (
-                            not str(column[key]) == str(row[0][key])
-                        ):
-                            self.tables_to_fix.append((table, "WRONG_SETUP", column))
-                        continue
-
-                    # handle everything else
-                    if not str(column[key]) == str(row[0][key]):
-                        self.tables_to_fix.append((table, "WRONG_SETUP", column))
-                        continue
+                if not self._column_matches(column, row):
+                    self.tables_to_fix.append((table, "WRONG_SETUP", column))
 
             # test if primary key exists
-            cursor.execute(
-                "SELECT table_name, column_name, constraint_name FROM information_schema.constraint_column_usage WHERE column_name=%s AND constraint_name=%s;",
-                [table["primary_key"], f"{table['table_name']}_pkey"],
-            )
-            result = cursor.fetchall()
-
-            if len(result) == 0:
+            if not (table["table_schema"], f"{table['table_name']}_pkey", table["primary_key"]) in pkeys:
                 self.tables_to_fix.append((table, "MISSING_PKEY"))
+
+        # test if all indexes exist. this happens last, so missing columns are added before their index
+        missing = set(fix[0]["table_name"] for fix in self.tables_to_fix if fix[1] == "MISSING")
+        for table in self.tables:
+            # missing tables get their indexes when they are created
+            if table["table_name"] in missing:
                 continue
-        # close the cursor and finish up
-        cursor.close()
+
+            for index in table.get("indexes", []):
+                if not (table["table_schema"], index["index_name"]) in indexes:
+                    self.tables_to_fix.append((table, "MISSING_INDEX", index))
+
+        # finish up
         if len(self.tables_to_fix) > 0:
             return False
         else:
             return True
 
+    @staticmethod
+    def _column_matches(column:dict, row) -> bool:
+        """compare a column from the template with its row from information_schema.columns"""
+
+        # scan through columns and see if all are set up correctly
+        for key in column:
+
+            # these keys are unimportant for the comparison, and i don't know how to test for them
+            if key in ("auto_increment", "generated"):
+                continue
+
+            # yay, we arrived at nullable, now we have to handle the YES and NO
+            if key == "is_nullable":
+                nullable = "YES" if column[key] else "NO"
+                if not nullable == row[key]:
+                    return False
+                continue
+
+            # this part handles boolean types and type comparison to Python bool
+            if row["data_type"] == "boolean" and key == "column_default" and not column["is_nullable"]:
+                if not column[key] == (str(row[key]).lower() == "true"):
+                    return False
+                continue
+
+            # The part that handles if the default_column being a string
+            if (
+                row["data_type"] == "character varying"
+                and key == "column_default"
+            ):
+                if not str(
+                    row[key]
+                ) == f"'{column[key]}'::character varying" and (
+                    not str(column[key]) == str(row[key])
+                ):
+                    return False
+                continue
+
+            # handle everything else
+            if not str(column[key]) == str(row[key]):
+                return False
+
+        return True
+
+    @contextlib.asynccontextmanager
+    async def schema_lock(self):
+        """
+        hold a database wide lock while the schema is verified and fixed,
+        so multiple processes don't try to fix the same tables at once
+        """
+        async with self.pool.acquire() as connection:
+            await connection.execute("SELECT pg_advisory_lock(hashtext('demonoverlord.schema'))")
+            try:
+                yield
+            finally:
+                await connection.execute("SELECT pg_advisory_unlock(hashtext('demonoverlord.schema'))")
+
+    @metrics.timed("database_query_seconds", query="schema_unchanged")
+    async def schema_unchanged(self) -> bool:
+        """
+        Test if the template and the database catalog are unchanged since the last successful verification.
+        This costs a single query, the catalog fingerprint is calculated by the database.
+        """
+        self.catalog_hash = await self.pool.fetchval(
+            """
+            SELECT md5(
+                coalesce((
+                    SELECT string_agg(concat_ws(',', table_schema, table_name, column_name, column_default, data_type, is_nullable, character_maximum_length), ';' ORDER BY table_schema, table_name, column_name)
+                    FROM information_schema.columns WHERE table_schema = ANY($1::text[])
+                ), '') || coalesce((
+                    SELECT string_agg(concat_ws(',', schemaname, tablename, indexname, indexdef), ';' ORDER BY schemaname, tablename, indexname)
+                    FROM pg_indexes WHERE schemaname = ANY($1::text[])
+                ), '')
+            );
+            """,
+            list(self.schemata),
+        )
+
+        try:
+            with open(self.schema_cache) as file:
+                cache = json.load(file)
+        except (OSError, ValueError):
+            return False
+
+        return cache.get("template") == self.template_hash and cache.get("catalog") == self.catalog_hash
+
+    async def save_schema_state(self) -> None:
+        """remember the verified template and catalog, so the next start can skip the verification"""
+        await self.schema_unchanged()
+        try:
+            with open(self.schema_cache, "w") as file:
+                json.dump({"template": self.template_hash, "catalog": self.catalog_hash}, file)
+        except OSError:
+            log(LogMessage("Could not save the schema verification cache", msg_type=LogType.WARNING))
+
+    @metrics.timed("database_query_seconds", query="schema_test")
     async def schema_test(self) -> bool:
         """A function to test if all schemas exist"""
 
-        # make cursor and get all schemas
-        cursor = self.connection_main.cursor()
-        cursor.execute("SELECT * FROM information_schema.schemata")
-        table = cursor.fetchall()
-        cursor.close()
+        # get all schemas
+        table = await self.pool.fetch("SELECT * FROM information_schema.schemata")
 
         # mark all existing schemas as such and leave others alone 
         count = 0
@@ -314,6 +532,7 @@ class DatabaseConfig(object):
         else:
             return False
 
+    @metrics.timed("database_query_seconds", query="table_fix")
     async def table_fix(self) -> None:
         """The function that fixes all broken tables and columns"""
 
@@ -324,17 +543,17 @@ class DatabaseConfig(object):
             try:
                 to_fix = self.tables_to_fix.pop(0)
             except IndexError:
-                print(LogMessage("All table issues fixed"))
+                log(LogMessage("All table issues fixed"))
                 break
 
             # the table doesn't exist
             if to_fix[1] == "MISSING":
-                print(LogMessage(f"Creating Table '{to_fix[0]['table_name']}'"))
+                log(LogMessage(f"Creating Table '{to_fix[0]['table_name']}'"))
                 await self._create_table(to_fix[0])
 
             # the primary key of the table is missing or incorrect
             elif to_fix[1] == "MISSING_PKEY":
-                print(
+                log(
                     LogMessage(
                         f"Creating PKEY '{to_fix[0]['primary_key']}' on Table '{to_fix[0]['table_name']}'"
                     )
@@ -347,13 +566,13 @@ class DatabaseConfig(object):
 
             # table has no columns
             elif to_fix[1] == "MISSING_COLS":  # none exist
-                print(
+                log(
                     LogMessage(f"Creating columns in Table '{to_fix[0]['table_name']}'")
                 )
 
                 # go through all columns and add them
                 for column in to_fix[0]["columns"]:
-                    print(
+                    log(
                         LogMessage(
                             f"Creating column '{column['column_name']}' in Table '{to_fix[0]['table_name']}'"
                         )
@@ -364,7 +583,7 @@ class DatabaseConfig(object):
 
             # database has certain columns missing
             elif to_fix[1] == "MISSING_COL":  # single missing case
-                print(
+                log(
                     LogMessage(
                         f"Add missing column '{to_fix[2]['column_name']}' in Table '{to_fix[0]['table_name']}'"
                     )
@@ -375,7 +594,7 @@ class DatabaseConfig(object):
 
             # the column id not set up correctly
             elif to_fix[1] == "WRONG_SETUP": 
-                print(
+                log(
                     LogMessage(
                         f"Correcting column '{to_fix[2]['column_name']}' in Table '{to_fix[0]['table_name']}'"
                     )
@@ -384,9 +603,19 @@ class DatabaseConfig(object):
                     to_fix[0]["table_name"], to_fix[0]["table_schema"], to_fix[2]
                 )
 
+            # the table is missing an index
+            elif to_fix[1] == "MISSING_INDEX":
+                log(
+                    LogMessage(
+                        f"Creating index '{to_fix[2]['index_name']}' on Table '{to_fix[0]['table_name']}'"
+                    )
+                )
+                await self._add_index(
+                    to_fix[0]["table_name"], to_fix[0]["table_schema"], to_fix[2]
+                )
+
     async def _create_table(self, table: dict) -> None:
         """the function to create a table from a template"""
-        cursor = self.connection_main.cursor()
         columns = []
 
         for column in table["columns"]:
@@ -414,8 +643,11 @@ class DatabaseConfig(object):
                 else ""
             )
 
-            # aggregate column specific query snippets
-            query = f"{column['column_name']} {column['data_type'] if not column['auto_increment'] else 'serial'}{max_len} {nullable} {default if not column['column_default'] is None else ''}"
+            # aggregate column specific query snippets, generated columns can't have defaults
+            if column.get("generated"):
+                query = f"{column['column_name']} {column['data_type']}{max_len} GENERATED ALWAYS AS ({column['generated']}) STORED"
+            else:
+                query = f"{column['column_name']} {column['data_type'] if not column['auto_increment'] else 'serial'}{max_len} {nullable} {default if not column['column_default'] is None else ''}"
             columns.append(query)
 
         # do we need a primary key?
@@ -424,29 +656,31 @@ class DatabaseConfig(object):
                 f"CONSTRAINT \"{table['table_name']}_pkey\" PRIMARY KEY ({table['primary_key']})"
             )
 
-        # send the query
-        query = f"CREATE TABLE {table['table_schema']}.{table['table_name']} ({','.join(columns)}) TABLESPACE {table['table_space']}"
-        cursor.execute(query)
+        async with self.pool.acquire() as connection:
+            # send the query
+            query = f"CREATE TABLE {table['table_schema']}.{table['table_name']} ({','.join(columns)}) TABLESPACE {table['table_space']}"
+            await connection.execute(query)
 
-        # add any comment that exists (Null returns false)
-        if table["comment"]:
-            cursor.execute(
-                f"COMMENT ON TABLE {table['table_schema']}.{table['table_name']} IS %s;",
-                [table["comment"]],
-            )
-        cursor.close()
+            # add any comment that exists (Null returns false). utility statements can't take parameters
+            if table["comment"]:
+                comment = table["comment"].replace("'", "''")
+                await connection.execute(
+                    f"COMMENT ON TABLE {table['table_schema']}.{table['table_name']} IS '{comment}';"
+                )
+
+        # add all indexes of the table
+        for index in table.get("indexes", []):
+            await self._add_index(table["table_name"], table["table_schema"], index)
 
     async def _fix_pkey(self, table_name:str, schema_name:str, column:dict) -> None:
         """This fixes the table if the primary key is not set correctly. It simply overwrites the current PKEY"""
 
-        cursor = self.connection_main.cursor()
-        cursor.execute(
+        await self.pool.execute(
             f"ALTER TABLE {schema_name}.{table_name} ADD PRIMARY KEY ({column})"
         )
 
     async def _add_column(self, table_name:str, schema_name:str, column:dict) -> None:
         """This adds a column to a table"""
-        cursor = self.connection_main.cursor()
 
         # some stuff to prepare
         nullable = "NOT NULL" if not column["is_nullable"] else ""
@@ -467,16 +701,31 @@ class DatabaseConfig(object):
         nullable = "NOT NULL" if not column["is_nullable"] else ""
         default = f"DEFAULT {escape_val}"
 
+        # generated columns are filled for all existing rows as soon as they are added
+        if column.get("generated"):
+            max_len = (
+                f"({column['character_maximum_length']})"
+                if column["character_maximum_length"]
+                else ""
+            )
+            await self.pool.execute(
+                f"ALTER TABLE {schema_name}.{table_name} ADD {column['column_name']} {column['data_type']}{max_len} GENERATED ALWAYS AS ({column['generated']}) STORED;"
+            )
+            return
+
         # the query
-        cursor.execute(
+        await self.pool.execute(
             f"ALTER TABLE {schema_name}.{table_name} ADD {column['column_name']} {column['data_type'] if not column['auto_increment'] else 'serial'} {nullable} {default if column['column_default'] else ''};"
         )
-        cursor.close()
+
+    async def _add_index(self, table_name:str, schema_name:str, index:dict) -> None:
+        """This adds an index to a table"""
+        await self.pool.execute(
+            f"CREATE INDEX IF NOT EXISTS {index['index_name']} ON {schema_name}.{table_name} USING {index['method']} ({index['columns']});"
+        )
 
     async def _fix_column(self, table_name:str, schema_name:str, column:dict) -> None:
         """This fixes a column if a it has not been set up properly"""
-        
-        cursor = self.connection_main.cursor()
 
         # handle maximum legth
         max_len = (
@@ -490,125 +739,269 @@ class DatabaseConfig(object):
             else f"{column['column_default']}"
         )
 
-        # set the data type
-        cursor.execute(
-            f"ALTER TABLE {schema_name}.{table_name} ALTER COLUMN {column['column_name']} TYPE {column['data_type'] if not column['auto_increment'] else 'serial'}{max_len};"
-        )
+        # all alterations of one column happen on the same connection, in one transaction
+        async with self.pool.acquire() as connection:
+            async with connection.transaction():
 
-        # set  or unset default value
-        if column["column_default"] is not None:
-            cursor.execute(
-                f"ALTER TABLE {schema_name}.{table_name} ALTER COLUMN {column['column_name']} SET DEFAULT {escape_val}"
-            )
-        else:
-            cursor.execute(
-                f"ALTER TABLE {schema_name}.{table_name} ALTER COLUMN {column['column_name']} DROP DEFAULT "
-            )
+                # set the data type
+                await connection.execute(
+                    f"ALTER TABLE {schema_name}.{table_name} ALTER COLUMN {column['column_name']} TYPE {column['data_type'] if not column['auto_increment'] else 'serial'}{max_len};"
+                )
 
-        # set or unset NOT NULL constraint
-        if not column["is_nullable"]:
-            cursor.execute(
-                f"ALTER TABLE {schema_name}.{table_name} ALTER COLUMN {column['column_name']} SET NOT NULL"
-            )
-        else:
-            cursor.execute(
-                f"ALTER TABLE {schema_name}.{table_name} ALTER COLUMN {column['column_name']} DROP NOT NULL"
-            )
-        cursor.close()
+                # set  or unset default value, generated columns have an expression instead
+                if column.get("generated"):
+                    pass
+                elif column["column_default"] is not None:
+                    await connection.execute(
+                        f"ALTER TABLE {schema_name}.{table_name} ALTER COLUMN {column['column_name']} SET DEFAULT {escape_val}"
+                    )
+                else:
+                    await connection.execute(
+                        f"ALTER TABLE {schema_name}.{table_name} ALTER COLUMN {column['column_name']} DROP DEFAULT "
+                    )
+
+                # set or unset NOT NULL constraint
+                if not column["is_nullable"]:
+                    await connection.execute(
+                        f"ALTER TABLE {schema_name}.{table_name} ALTER COLUMN {column['column_name']} SET NOT NULL"
+                    )
+                else:
+                    await connection.execute(
+                        f"ALTER TABLE {schema_name}.{table_name} ALTER COLUMN {column['column_name']} DROP NOT NULL"
+                    )
 
-    async def add_guild(self, guild:int) -> None:
+    @metrics.timed("database_query_seconds", query="add_guild")
+    async def add_guild(self, guild:discord.Guild) -> None:
         """Add a guild to the mandatory tables in the database"""
-        cursor = self.connection_main.cursor()
+        async with self.pool.acquire() as connection:
+            async with connection.transaction():
+                await self._add_guilds(connection, [guild])
+
+    @metrics.timed("database_query_seconds", query="remove_guild")
+    async def remove_guild(self, guild:discord.Guild) -> None:
+        """Remove a guild from all tables"""
+        async with self.pool.acquire() as connection:
+            async with connection.transaction():
+                await self._remove_guilds(connection, [guild.id])
+
+    @metrics.timed("database_query_seconds", query="update_guilds")
+    async def update_guilds(self, guilds: list, shard_ids: list = None, shard_count: int = None) -> tuple:
+        """
+        Reconcile the database with the guilds the bot is in: add missing guilds, update when they were last seen
+        and remove guilds the bot has left. Every step is a single set based statement per table.
+        If `shard_ids` is given, only guilds on these shards are reconciled, the others belong to other processes.
+        returns the number of added and removed guilds
+        """
+        guild_ids = [guild.id for guild in guilds]
+
+        async with self.pool.acquire() as connection:
+            async with connection.transaction():
+                known = set(await connection.fetchval("SELECT coalesce(array_agg(guild_id), '{}') FROM public.guilds"))
+                if shard_ids is not None:
+                    shards = set(shard_ids)
+                    known = {guild_id for guild_id in known if (guild_id >> 22) % shard_count in shards}
+
+                # all guilds we're in, this adds the ones we joined while we were offline and updates last_seen
+                added = [guild for guild in guilds if not guild.id in known]
+                await self._add_guilds(connection, guilds)
+
+                # guilds we left while we were offline
+                current = set(guild_ids)
+                removed = [guild_id for guild_id in known if not guild_id in current]
+                await self._remove_guilds(connection, removed)
+
+        return len(added), len(removed)
+
+    async def _add_guilds(self, connection, guilds: list) -> None:
+        """add default entries for a batch of guilds, existing entries only get their last_seen updated"""
+        if len(guilds) == 0:
+            return
+        guild_ids = [guild.id for guild in guilds]
+
         for table in self.necessary_tables:
             if not table["all_required"]:
                 # these ones can be set by default
-                cursor.execute(f"INSERT INTO {table['table_schema']}.{table['table_name']} (guild_id) VALUES (%s)", [guild.id])
-        
-        # manual insertion of data
-        cursor.execute(f"INSERT INTO public.last_seen (guild_id, joined_at, last_seen) VALUES (%s, %s, %s)", [guild.id, int(datetime.datetime.timestamp(guild.me.joined_at)), int(time.time())])
-        cursor.close()
+                await connection.execute(
+                    f"INSERT INTO {table['table_schema']}.{table['table_name']} (guild_id) SELECT unnest($1::bigint[]) ON CONFLICT ({table['primary_key']}) DO NOTHING",
+                    guild_ids,
+                )
 
-    async def check_guilds(self, bot:discord.Client):
-        cursor = self.connection_main.cursor()
+        # manual insertion of data
+        await connection.execute(
+            """
+            INSERT INTO public.guilds (guild_id, joined_at, last_seen)
+            SELECT guild_id, joined_at, $3 FROM unnest($1::bigint[], $2::bigint[]) AS g(guild_id, joined_at)
+            ON CONFLICT (guild_id) DO UPDATE SET last_seen=EXCLUDED.last_seen, joined_at=coalesce(EXCLUDED.joined_at, guilds.joined_at)
+            """,
+            guild_ids,
+            [
+                int(datetime.datetime.timestamp(guild.me.joined_at)) if guild.me and guild.me.joined_at else None
+                for guild in guilds
+            ],
+            int(time.time()),
+        )
 
-    async def remove_guild(self, guild:int) -> None:
-        """Remove a guild from all tables"""
-        cursor = self.connection_main.cursor()
+    async def _remove_guilds(self, connection, guild_ids: list) -> None:
+        """remove a batch of guilds from all tables that hold guild data"""
+        if len(guild_ids) == 0:
+            return
 
-        for table in self.tables:
-            cursor.execute(f"DELETE FROM {table['table_schema']}.{table['table_name']} WHERE guild_id=%s", [guild.id])
-        cursor.close()
+        for table in self.guild_tables:
+            await connection.execute(
+                f"DELETE FROM {table['table_schema']}.{table['table_name']} WHERE guild_id = ANY($1::bigint[])",
+                guild_ids,
+            )
 
-    async def update_guilds(self, guilds: list):
-        cursor = self.connection_main.cursor()
+        for guild_id in guild_ids:
+            self.invalidate_settings(guild_id)
 
     async def _fix_guild_entry(self, table_name:str, schema_name:str, guild_id:int, column:dict) -> None:
         """fix a wrong default value (Null where NOT NULL is set)"""
-        cursor = self.connection_main.cursor()
-        cursor.execute(f"UPDATE {schema_name}.{table_name} SET column=%s WHERE guild_id=%s", [column["column_default"], guild_id])
-        cursor.close()
+        await self.pool.execute(f"UPDATE {schema_name}.{table_name} SET column=$1 WHERE guild_id=$2", column["column_default"], guild_id)
+
+    def invalidate_settings(self, guild_id) -> None:
+        """Drop all cached settings of a guild, this has to be called whenever they are changed"""
+        self.settings.invalidate(("welcome", guild_id))
+        self.settings.invalidate(("autorole", guild_id))
+
+    async def _get_setting(self, setting:str, query:str, guild_id) -> dict:
+        """Get a settings row from the cache or the database. Missing rows are cached as well"""
+        res = self.settings.get((setting, guild_id))
+        if res is MISSING:
+            with metrics.time("database_query_seconds", query=f"get_{setting}"):
+                res = await self.pool.fetchrow(query, guild_id)
+            res = dict(res) if res else None
+            self.settings.set((setting, guild_id), res)
+        return res
 
     async def get_welcome(self, guild_id, *,  wait_pending=False) -> dict:
-        with self.connection_main.cursor() as cursor:
-            cursor.execute(f"SELECT * FROM admin.welcome_messages WHERE guild_id=%s", [guild_id])
+        res = await self._get_setting("welcome", "SELECT * FROM admin.welcome_messages WHERE guild_id=$1", guild_id)
 
-            if (res := cursor.fetchone()):
-                return res if res["wait_pending"] == wait_pending else None
-            else:
-                return None
+        # hand out a copy, so callers can't change the cached row
+        if res:
+            return dict(res) if res["wait_pending"] == wait_pending else None
+        else:
+            return None
 
     async def update_welcome(self) -> None:
         pass
     
     async def get_autorole(self, guild_id, *, wait_pending=False) -> list():
-        with self.connection_main.cursor() as cursor:
-            cursor.execute(f"SELECT * FROM admin.autoroles WHERE guild_id=%s", [guild_id])
-            if (res := cursor.fetchone()):
-                return res if res["wait_pending"] == wait_pending else None
-            else:
-                return None
+        res = await self._get_setting("autorole", "SELECT * FROM admin.autoroles WHERE guild_id=$1", guild_id)
+        if res:
+            return dict(res) if res["wait_pending"] == wait_pending else None
+        else:
+            return None
 
+    @metrics.timed("database_query_seconds", query="add_autorole")
     async def add_autorole(self, guild_id, role_id, delay=None, wait_pending=None):
-        with self.connection_main.cursor() as cursor:
-            attr = [guild_id, role_id]
-            col_delay = col_wait = ""
-            values = "%s, %s"
+        attr = [guild_id, role_id]
+        col_delay = col_wait = ""
+        values = "$1, $2"
+
+        if delay != None:
+            col_delay =',delay'
+            attr.append(delay)
+            values += f",${len(attr)}"
+
+        if wait_pending != None:
+            col_wait = ',wait_pending' 
+            attr.append(wait_pending)
+            values += f",${len(attr)}"
+
+        await self.pool.execute(f"INSERT INTO admin.autoroles (guild_id, role_id {col_delay} {col_wait}) VALUES ({values})", *attr)
+        self.invalidate_settings(guild_id)
+
+    @metrics.timed("database_query_seconds", query="get_ratelimits")
+    async def get_ratelimits(self) -> list:
+        """Get all custom rate limits"""
+        return await self.pool.fetch("SELECT guild_id, command_name, limit_to, per_interval FROM admin.ratelimits")
+
+    @metrics.timed("database_query_seconds", query="add_ratelimit_counters")
+    async def add_ratelimit_counters(self, counters:dict) -> None:
+        """Add a batch of `{(guild_id, command_name): [accepted, rejected]}` counters in a single statement"""
+        keys = list(counters.keys())
+        await self.pool.execute(
+            """
+            INSERT INTO admin.ratelimit_counters (counter_id, guild_id, command_name, accepted, rejected)
+            SELECT * FROM unnest($1::varchar[], $2::bigint[], $3::varchar[], $4::bigint[], $5::bigint[])
+            ON CONFLICT (counter_id) DO UPDATE
+            SET accepted=ratelimit_counters.accepted + EXCLUDED.accepted, rejected=ratelimit_counters.rejected + EXCLUDED.rejected
+            """,
+            [f"{guild_id}:{name}" for guild_id, name in keys],
+            [guild_id for guild_id, name in keys],
+            [name for guild_id, name in keys],
+            [counters[key][0] for key in keys],
+            [counters[key][1] for key in keys],
+        )
 
-            if delay != None:
-                col_delay =',delay'
-                attr.append(delay)
-                values += ",%s"
+    @metrics.timed("database_query_seconds", query="update_steamdata")
+    async def update_steamdata(self, records, batch_size:int=10000) -> int:
+        """
+        Bulk load `(appid, game_name, store_url, image_url)` rows from an async iterable into public.steam_data.
+        The rows are copied into a staging table in batches and merged with a single upsert, returns the number of changed rows.
+        """
+        async with self.pool.acquire() as connection:
+            async with connection.transaction():
+                await connection.execute(
+                    "CREATE TEMPORARY TABLE steam_data_staging (appid bigint, game_name character varying(256), store_url character varying(256), image_url character varying) ON COMMIT DROP"
+                )
 
-            if wait_pending != None:
-                col_wait = ',wait_pending' 
-                values += ",%s"
-                attr.append(wait_pending)
+                # only ever hold one batch, so memory stays flat no matter how big the catalog gets
+                batch = []
+                async for record in records:
+                    batch.append(record)
+                    if len(batch) >= batch_size:
+                        await self._copy_steam_batch(connection, batch)
+                        batch = []
+                if batch:
+                    await self._copy_steam_batch(connection, batch)
+
+                # the applist has duplicate appids, an upsert can't touch the same row twice
+                status = await connection.execute(
+                    """
+                    INSERT INTO public.steam_data (appid, game_name, store_url, image_url)
+                    SELECT DISTINCT ON (appid) appid, game_name, store_url, image_url FROM steam_data_staging ORDER BY appid
+                    ON CONFLICT (appid) DO UPDATE
+                    SET game_name=EXCLUDED.game_name, store_url=EXCLUDED.store_url, image_url=EXCLUDED.image_url
+                    WHERE (steam_data.game_name, steam_data.store_url, steam_data.image_url)
+                        IS DISTINCT FROM (EXCLUDED.game_name, EXCLUDED.store_url, EXCLUDED.image_url)
+                    """
+                )
 
-            cursor.execute(f"INSERT INTO admin.autoroles (guild_id, role_id {col_delay} {col_wait}) VALUES ({values})", attr)
+        # the status looks like "INSERT 0 {rows}"
+        return int(status.split(" ")[-1])
 
-            cursor.execute(f"SELECT * FROM admin.autoroles WHERE guild_id=%s", [guild_id])
-            res = cursor.fetchall()
+    async def _copy_steam_batch(self, connection, batch:list) -> None:
+        """COPY a batch of steam rows into the staging table"""
+        await connection.copy_records_to_table(
+            "steam_data_staging",
+            records=batch,
+            columns=["appid", "game_name", "store_url", "image_url"],
+        )
 
+    @metrics.timed("database_query_seconds", query="schema_fix")
     async def schema_fix(self) -> None:
         """"adds any schema marked as missing"""
-        cursor = self.connection_main.cursor(cursor_factory=psycopg2.extras.DictCursor)
+        async with self.pool.acquire() as connection:
 
-        # step through all schemas and check the ones that aren't marked (False), then add it
-        for key in self.schemata:
-            if not self.schemata[key]:
-                cursor.execute(f"CREATE SCHEMA {key} AUTHORIZATION bot;")
-                cursor.execute(f"GRANT ALL ON SCHEMA {key} TO bot;")
-
-        cursor.close()
+            # step through all schemas and check the ones that aren't marked (False), then add it
+            for key in self.schemata:
+                if not self.schemata[key]:
+                    await connection.execute(f"CREATE SCHEMA {key} AUTHORIZATION bot;")
+                    await connection.execute(f"GRANT ALL ON SCHEMA {key} TO bot;")
 
 
 class CommandConfig(object):
     """
-    This is the Command Config class. It handles all the secondary configurations for specific commands and/or command groups
+    This is the Command Config class. It handles all the secondary configurations for specific commands and/or command groups.
+    It is never changed after it is created, a reload creates a new one (see DemonOverlord.reload_commands)
     """
 
-    def __init__(self, confdir: str):
+    def __init__(self, confdir: str, izzymojis: dict = None):
         # initialize all variables
+        self.confdir = confdir
+        self.hash = None
         self.interactions = None
         self.command_info = None
         self.list = []
@@ -618,28 +1011,20 @@ class CommandConfig(object):
         self.short = dict()
         self.minecraft = dict()
 
-        # load command configuration from files
-        with open(os.path.join(confdir, "interactions.json")) as f:
-            self.interactions = json.load(f)
-
-        with open(os.path.join(confdir, "cmd_info.json")) as f:
-            self.command_info = json.load(f)
-
-        with open(os.path.join(confdir, "special/izzy.json")) as f:
-            self.izzylinks = json.load(f)
-
-        # load in the command list and update the short commands
-        for i in self.command_info.keys():
-            for j in self.command_info[i]["commands"]:
-                self.list.append(j)
-                if j["short"]:
-                    self.short.update({j["short"]: j["command"]})
-
-        # generate the ratelimit for all interactions
-        self.list.append(
-            {
-                "command": "interactions",
-                "ratelimit": self.command_info["interactions"]["ratelimit"],
-            }
-        )
+        # load command configuration from the validated config snapshot, the command list and short commands
+        # are derived when the snapshot is built
+        config = snapshot.load(confdir)
+        self.hash = config["command_hash"]
+        self.interactions = config["interactions"]
+        self.command_info = config["command_info"]
+        self.izzylinks = config["izzylinks"]
+        self.list = config["list"]
+        self.short = config["short"]
+        self.by_name = {command["command"]: command for command in self.list}
+
+        # help and izzy pages, rendered on first use
+        self.responses = ResponseCache()
+
+        # the interactions compiled with the bot's emoji, without them until the bot is connected (see on_ready)
+        self.catalog = InteractionCatalog(self.interactions, izzymojis or dict())
 
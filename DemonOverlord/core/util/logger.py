@@ -1,4 +1,11 @@
+import atexit
 import datetime
+import queue
+import random
+import re
+import sys
+import threading
+import ujson as json
 
 
 class LogFormat:
@@ -24,6 +31,7 @@ class LogFormat:
 class LogType:
     """An enum that holds pre-formatted message types"""
 
+    DEBUG = f"{LogFormat.format('DEBUG', LogFormat.HEADER)}"
     MESSAGE = f"{LogFormat.format('MESSAGE', LogFormat.OKGREEN)}"
     COMMAND = f"{LogFormat.format('COMMAND', LogFormat.OKGREEN)}"
     COMMAND_ERR = f"{LogFormat.format('COMMAND_ERR', LogFormat.FAIL)}"
@@ -31,11 +39,25 @@ class LogType:
     WARNING = f"{LogFormat.format('WARNING', LogFormat.WARNING)}"
 
 
+# name and severity of every message type, used for level filtering and json output
+LOG_LEVELS = {
+    LogType.DEBUG: ("DEBUG", 10),
+    LogType.MESSAGE: ("MESSAGE", 20),
+    LogType.COMMAND: ("COMMAND", 20),
+    LogType.WARNING: ("WARNING", 30),
+    LogType.ERROR: ("ERROR", 40),
+    LogType.COMMAND_ERR: ("COMMAND_ERR", 40),
+}
+
+# matches terminal escape sequences, they are removed from json output
+ESCAPE_SEQUENCE = re.compile(r"\033\[[0-9;]*m")
+
 
 class LogMessage:
     """Builds a message with optional Timestamp
 
-    - `message` - a string representing the message
+    - `message` - a string representing the message, or a function returning it. functions are only called
+      if the message is actually written, so expensive messages should be passed as a lambda
     - `msg_type` - a string representing the message prefix, see LogType
     - `time` - a boolean value to turn timestamp on or off (timestamp is in utc time)
     - `color` - a string representing the Terminal escape sequence to format the message
@@ -52,10 +74,23 @@ class LogMessage:
         time: bool = True,
         color: LogFormat = None,
     ):
+        self.name, self.level = LOG_LEVELS.get(msg_type, ("MESSAGE", 20))
         self.type = msg_type if not color else LogFormat.format(msg_type, color)
         self.time = datetime.datetime.utcnow() if time else None
         self.message = message
 
+    @property
+    def text(self) -> str:
+        return str(self.message()) if callable(self.message) else str(self.message)
+
+    def to_dict(self) -> dict:
+        """the structured form of this message, used for json output"""
+        return {
+            "time": self.time.isoformat() if self.time else None,
+            "type": self.name,
+            "message": ESCAPE_SEQUENCE.sub("", self.text),
+        }
+
     def __str__(self):
         """
         there are two outputs, based on whether time is enabled or not:
@@ -64,9 +99,9 @@ class LogMessage:
         output: `[{prefix="MESSAGE"}] {message}`
         """
         if self.time:
-            return f"[{self.type}] [TIME: {self.time}] {self.message}"
+            return f"[{self.type}] [TIME: {self.time}] {self.text}"
         else:
-            return f"[{self.type}] {self.message}"
+            return f"[{self.type}] {self.text}"
 
 
 class LogHeader(LogMessage):
@@ -85,15 +120,119 @@ class LogHeader(LogMessage):
 
 
 class LogCommand(LogMessage):
-    """This creates a log messsage specifically for a command"""
+    """This creates a log messsage specifically for a command, the message is only built when it is written"""
 
     def __init__(self, command, time=False):
         type = LogType.COMMAND
 
-        super().__init__("", msg_type=type, time=time)
+        super().__init__("INCOMING COMMAND", msg_type=type, time=time)
+
+        self.command = command.command
+        self.action = command.action
+        self.params = command.params
+
+    def to_dict(self) -> dict:
+        out = super().to_dict()
+        out.update(command=self.command, action=self.action, params=[str(param) for param in self.params or ()])
+        return out
+
+    def __str__(self) -> str:
+        width = len(self.type) + 9 + (len(str(self.time)) + 9 if self.time else 0)
+
+        message = self.message
+        message += f"\n{LogFormat.format('COMMAND', LogFormat.UNDERLINE).rjust(width)} : {str(self.command)}"
+        message += f"\n{LogFormat.format('ACTION', LogFormat.UNDERLINE).rjust(width): <7} : {self.action}"
+        message += f"\n{LogFormat.format('PARAMS', LogFormat.UNDERLINE).rjust(width): <7} : {str(self.params)}"
+
+        if self.time:
+            return f"[{self.type}] [TIME: {self.time}] {message}"
+        else:
+            return f"[{self.type}] {message}"
+
+
+class Logger(object):
+    """
+    This is the logging pipeline. Entries are filtered by level and sampled per category on the calling thread,
+    which only costs a few comparisons. Formatting and writing happens on a background thread,
+    so logging never blocks the event loop.
 
-        self.message = f"INCOMING COMMAND"
-        self.message += f"\n{LogFormat.format('COMMAND', LogFormat.UNDERLINE).rjust(len(self.type)+9+(len(str(self.time))+9 if self.time else 0))} : {str(command.command)}"
-        self.message += f"\n{LogFormat.format('ACTION', LogFormat.UNDERLINE).rjust(len(self.type)+9+(len(str(self.time))+9 if self.time else 0)): <7} : {command.action}"
-        self.message += f"\n{LogFormat.format('PARAMS', LogFormat.UNDERLINE).rjust(len(self.type)+9+(len(str(self.time))+9 if self.time else 0)): <7} : {str(command.params)}"
+    - `level` - the name of the lowest message type that is written, see LOG_LEVELS
+    - `output` - "console" for the formatted terminal output or "json" for one json object per line
+    - `sampling` - the share of messages that is written per category, categories without an entry are always written
+    """
 
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+        self.level = 20
+        self.json = False
+        self.sampling = dict()
+
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def configure(self, level: str = "MESSAGE", output: str = "console", sampling: dict = None) -> None:
+        levels = {name: value for name, value in LOG_LEVELS.values()}
+        self.level = levels[level.upper()]
+        self.json = output == "json"
+        self.sampling = dict(sampling or {})
+
+    def log(self, entry: LogMessage, category: str = None) -> None:
+        if entry.level < self.level:
+            return
+
+        rate = self.sampling.get(category)
+        if rate is not None and random.random() >= rate:
+            return
+
+        if self._thread is None:
+            self._start()
+        self._queue.put(entry)
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="logger", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            entry = self._queue.get()
+            if entry is None:
+                break
+
+            try:
+                line = json.dumps(entry.to_dict()) if self.json else str(entry)
+            except Exception as e:
+                # the error is written in the same format, so json streams stay parseable
+                message = f"Failed to format log entry: {type(e).__name__}: {e}"
+                if self.json:
+                    line = json.dumps(
+                        {"time": datetime.datetime.utcnow().isoformat(), "type": LOG_LEVELS[LogType.ERROR][0], "message": message}
+                    )
+                else:
+                    line = f"[{LogType.ERROR}] {message}"
+
+            self.stream.write(line + "\n")
+
+            # flush once the queue ran empty, not for every line
+            if self._queue.empty():
+                self.stream.flush()
+
+    def close(self) -> None:
+        """write all remaining entries and stop the background thread"""
+        with self._lock:
+            if self._thread is not None:
+                self._queue.put(None)
+                self._thread.join()
+                self._thread = None
+
+
+# the logger of the bot, everything should log through `log`
+logger = Logger()
+atexit.register(logger.close)
+
+
+def log(entry: LogMessage, category: str = None) -> None:
+    """queue a message for the log. `category` is used for sampling, see Logger"""
+    logger.log(entry, category)
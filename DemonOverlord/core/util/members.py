@@ -0,0 +1,63 @@
+import asyncio
+import discord
+
+from DemonOverlord.core.util.cache import LRUCache, MISSING
+from DemonOverlord.core.util.logger import LogMessage, LogType, log
+
+
+class MemberCache(object):
+    """
+    This fetches members that are not in discord.py's member cache. With a lean intent profile only a few members
+    are cached, everyone else is fetched on demand and kept in a bounded LRU. Missing members are cached as None.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = None):
+        self.members = LRUCache(maxsize=maxsize, ttl=ttl)
+
+    def peek(self, guild: discord.Guild, member_id: int):
+        """get a member from discord.py's cache or ours, without fetching"""
+        member = guild.get_member(member_id)
+        if member is None:
+            member = self.members.get((guild.id, member_id), None)
+        return member
+
+    async def get(self, guild: discord.Guild, member_id: int):
+        """get a member by id, fetch it if it isn't cached"""
+        member = guild.get_member(member_id)
+        if member is not None:
+            return member
+
+        key = (guild.id, member_id)
+        member = self.members.get(key)
+        if member is MISSING:
+            try:
+                member = await guild.fetch_member(member_id)
+            except discord.NotFound:
+                member = None
+            self.members.set(key, member)
+        return member
+
+    async def get_named(self, guild: discord.Guild, name: str):
+        """get a member by name or nickname, ask discord for it if it isn't cached"""
+        member = guild.get_member_named(name)
+        if member is not None:
+            return member
+
+        key = (guild.id, name)
+        member_id = self.members.get(key)
+        if member_id is MISSING:
+            try:
+                # the result is kept in our cache, discord.py's cache would grow without bounds
+                found = await guild.query_members(query=name, limit=5, cache=False)
+            except (discord.ClientException, discord.HTTPException, asyncio.TimeoutError) as e:
+                log(LogMessage(f"Looking up member '{name}' failed: {type(e).__name__}", msg_type=LogType.WARNING))
+                return None
+
+            member = next((m for m in found if name in (m.name, m.nick)), None)
+            member_id = member.id if member else None
+            self.members.set(key, member_id)
+            if member:
+                self.members.set((guild.id, member.id), member)
+            return member
+
+        return self.peek(guild, member_id) if member_id is not None else None
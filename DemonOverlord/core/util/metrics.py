@@ -0,0 +1,173 @@
+import functools
+import time
+from bisect import bisect_left
+
+from aiohttp import web
+
+
+# latency buckets in seconds, from a fast dict lookup up to a slow api call
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram(object):
+    """
+    This is a latency histogram with fixed buckets. Observations only increment a single bucket,
+    the cumulative counts Prometheus expects are computed on render.
+    """
+
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: tuple = DEFAULT_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Counter(object):
+    """This is a monotonic counter"""
+
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+
+class Timer(object):
+    """
+    This is a context manager, that observes the time spent in its block in a histogram.
+    It can be used around awaits as well, the time then includes waiting for the result.
+    """
+
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram: Histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+class Metrics(object):
+    """
+    This is the registry of all metrics of the bot. Metrics are identified by name and labels and created on first use.
+    Labels must come from a bounded set of values (command names, not user input), every combination is its own series.
+
+    The metrics are served in the Prometheus text format by a small aiohttp server, see `start()`.
+    """
+
+    def __init__(self):
+        self.histograms = dict()
+        self.counters = dict()
+        self._runner = None
+
+    @staticmethod
+    def _key(name: str, labels: dict) -> tuple:
+        return (name, tuple(sorted(labels.items())))
+
+    def histogram(self, name: str, **labels) -> Histogram:
+        key = self._key(name, labels)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        return histogram
+
+    def counter(self, name: str, **labels) -> Counter:
+        key = self._key(name, labels)
+        counter = self.counters.get(key)
+        if counter is None:
+            counter = self.counters[key] = Counter()
+        return counter
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        self.histogram(name, **labels).observe(value)
+
+    def inc(self, name: str, amount: float = 1, **labels) -> None:
+        self.counter(name, **labels).inc(amount)
+
+    def time(self, name: str, **labels) -> Timer:
+        """time a block: `with metrics.time("database_query_seconds", query="get_welcome"): ...`"""
+        return Timer(self.histogram(name, **labels))
+
+    def timed(self, name: str, **labels):
+        """decorator version of `time()` for coroutine functions"""
+
+        def decorator(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                with self.time(name, **labels):
+                    return await func(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    @staticmethod
+    def _format_labels(labels: tuple, extra: tuple = ()) -> str:
+        labels = labels + extra
+        if not labels:
+            return ""
+
+        def escape(value) -> str:
+            return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+        return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in labels) + "}"
+
+    def render(self) -> str:
+        """all metrics in the Prometheus text exposition format"""
+        lines = []
+
+        typed = set()
+        for (name, labels), counter in sorted(self.counters.items()):
+            if name not in typed:
+                lines.append(f"# TYPE {name} counter")
+                typed.add(name)
+            lines.append(f"{name}{self._format_labels(labels)} {counter.value}")
+
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            if name not in typed:
+                lines.append(f"# TYPE {name} histogram")
+                typed.add(name)
+
+            cumulative = 0
+            for bound, count in zip(histogram.bounds, histogram.counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{self._format_labels(labels, (('le', bound),))} {cumulative}")
+            lines.append(f"{name}_bucket{self._format_labels(labels, (('le', '+Inf'),))} {histogram.count}")
+            lines.append(f"{name}_sum{self._format_labels(labels)} {histogram.sum}")
+            lines.append(f"{name}_count{self._format_labels(labels)} {histogram.count}")
+
+        return "\n".join(lines) + "\n"
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        return web.Response(text=self.render(), content_type="text/plain", charset="utf-8")
+
+    async def start(self, host: str, port: int) -> None:
+        """serve the metrics on http://{host}:{port}/metrics. this has to run on the bot's loop"""
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle)
+
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+# the metrics of the bot, everything should record through this
+metrics = Metrics()
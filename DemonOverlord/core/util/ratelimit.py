@@ -0,0 +1,126 @@
+import time
+
+from DemonOverlord.core.util.cache import LRUCache, MISSING
+
+
+class TokenBucket(object):
+    """
+    This is a single token bucket. It holds up to `capacity` tokens and gains `rate` tokens per second.
+    """
+
+    __slots__ = ("capacity", "rate", "tokens", "updated")
+
+    def __init__(self, capacity: float, rate: float, now: float):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.updated = now
+
+    def consume(self, now: float) -> float:
+        """take a token. returns 0 on success, otherwise the seconds until the next token is available"""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        else:
+            return (1 - self.tokens) / self.rate
+
+
+class RateLimiter(object):
+    """
+    This is the in-memory rate limiter for all commands. It is checked before any handler runs.
+
+    The default limits come from cmd_info.json (one execution every `limit` seconds, per user if `user_dependent`),
+    guilds can override them through admin.ratelimits (`limit_to` executions every `per_interval` seconds).
+    Counters for accepted and rejected executions are kept in memory and flushed to the database in batches.
+    """
+
+    def __init__(self, commands, max_buckets: int = 100000):
+        self.limits = dict()
+        self.overrides = dict()
+        self.buckets = LRUCache(maxsize=max_buckets)
+        self.counters = dict()
+
+        self.update_limits(commands)
+
+    def update_limits(self, commands) -> None:
+        """get the default limits from the command config"""
+        limits = dict()
+        for command in commands.list:
+            limits[command["command"]] = command["ratelimit"]
+
+        # buckets may have been created with the old limits
+        if limits != self.limits:
+            self.buckets.clear()
+        self.limits = limits
+
+    def check(self, command) -> float:
+        """
+        Check if a command may be executed and count it. returns 0 if it may, otherwise the seconds until it may run again
+        """
+        guild_id = command.guild.id if command.guild else 0
+        name = command.command
+
+        # get the limit for this command: guild override for the command, guild override for all commands or the default
+        override = self.overrides.get((guild_id, name)) or self.overrides.get((guild_id, None))
+        if override:
+            capacity, interval = override
+            user_dependent = True
+        else:
+            limit = self.limits.get(name)
+            if limit is None or limit["limit"] <= 0:
+                self._count(guild_id, name, True)
+                return 0
+            capacity, interval = 1, limit["limit"]
+            user_dependent = limit["user_dependent"]
+
+        key = (guild_id, command.invoked_by.id if user_dependent else None, name)
+        now = time.monotonic()
+
+        bucket = self.buckets.get(key)
+        if bucket is MISSING:
+            bucket = TokenBucket(capacity, capacity / interval, now)
+            self.buckets.set(key, bucket)
+
+        remaining = bucket.consume(now)
+        self._count(guild_id, name, remaining == 0)
+        return remaining
+
+    def _count(self, guild_id: int, name: str, accepted: bool) -> None:
+        counter = self.counters.get((guild_id, name))
+        if counter is None:
+            counter = self.counters[(guild_id, name)] = [0, 0]
+        counter[0 if accepted else 1] += 1
+
+    async def load_overrides(self, database) -> None:
+        """load all custom guild limits from admin.ratelimits"""
+        overrides = dict()
+        for row in await database.get_ratelimits():
+            if row["limit_to"] > 0 and row["per_interval"]:
+                overrides[(row["guild_id"], row["command_name"])] = (row["limit_to"], row["per_interval"])
+
+        # buckets may have been created with the old limits
+        if overrides != self.overrides:
+            self.buckets.clear()
+        self.overrides = overrides
+
+    async def flush(self, database) -> None:
+        """write all counters to the database in one batch and reset them. if the write fails they are kept"""
+        if len(self.counters) == 0:
+            return
+
+        counters, self.counters = self.counters, dict()
+        try:
+            await database.add_ratelimit_counters(counters)
+        except BaseException:
+            # merge them with the ones counted in the meantime, the next flush writes both
+            for key, (accepted, rejected) in counters.items():
+                counter = self.counters.get(key)
+                if counter is None:
+                    self.counters[key] = [accepted, rejected]
+                else:
+                    counter[0] += accepted
+                    counter[1] += rejected
+            raise
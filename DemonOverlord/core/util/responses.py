@@ -1,6 +1,8 @@
 import discord
 import re
 
+from DemonOverlord.core.util.cache import LRUCache
+
 
 class TextResponse(discord.Embed):
     """
@@ -29,6 +31,203 @@ class ImageResponse(discord.Embed):
         self.set_image(url=url)
 
 
+class ResponseCache(object):
+    """
+    This holds responses that only depend on the config, like the help pages. Every response is built once and
+    stored as an embed dict, later requests get a fresh copy of it. It belongs to a CommandConfig,
+    so a reload starts with an empty cache.
+    """
+
+    def __init__(self):
+        self.responses = dict()
+
+    def get(self, key, build):
+        """get a copy of the response stored under `key`, `build()` creates it if it isn't cached yet"""
+        cached = self.responses.get(key)
+        if cached is None:
+            response = build()
+            cached = self.responses[key] = (type(response), response.to_dict(), getattr(response, "timeout", 0))
+
+        cls, data, timeout = cached
+
+        # from_dict keeps the field dicts, the copy gets its own so it can be changed
+        response = cls.from_dict(data)
+        response._fields = [dict(field) for field in data.get("fields", ())]
+        response.timeout = timeout
+        return response
+
+
+# placeholders look like {user.name}, {@member name.mention}, {#channel.id}, {!role} or {server}.
+# names and arguments are bounded and can't overlap, so broken templates can't make the regex backtrack
+WELCOME_PLACEHOLDER = re.compile(
+    r"{(?P<ctrl_char>[#@!]?)(?P<ctrl_seq>[\w\s]{0,100})(?:\.(?P<ctrl_arg>\w{0,32}))?}"
+)
+
+
+class WelcomeTemplate(object):
+    """
+    This is a welcome message compiled for one guild. Every templated column is split into static text and slots,
+    references to the guild, its channels and roles are resolved at compile time, members are stored by id.
+    Compiled templates are cached per guild until the template, the guild, its channels or roles change.
+
+    Members that are not in discord.py's cache are looked up by name in `resolve()`, before the first render.
+    """
+
+    # the columns that are never templated
+    IGNORED = ("embed_color", "guild_id", "welcome_channel", "wait_pending")
+
+    cache = LRUCache(maxsize=4096)
+
+    def __init__(self, welcome: dict, guild: discord.Guild):
+        self.source = dict(welcome)
+        self.guild = guild
+        self.plan = dict()
+        self.members = None
+
+        for key, value in welcome.items():
+            if key not in self.IGNORED and isinstance(value, str) and value != "":
+                parts = self._compile(value)
+                if parts != (value,):
+                    self.plan[key] = parts[0] if len(parts) == 1 and isinstance(parts[0], str) else parts
+
+    @classmethod
+    def get(cls, welcome: dict, guild: discord.Guild):
+        """get the compiled template of a guild, compile it if the cached one is missing or outdated"""
+        template = cls.cache.get(guild.id, None)
+        if template is None or template.source != welcome or template.guild is not guild:
+            template = cls(welcome, guild)
+            cls.cache.set(guild.id, template)
+        return template
+
+    @classmethod
+    def invalidate(cls, guild_id: int) -> None:
+        cls.cache.invalidate(guild_id)
+
+    def _compile(self, text: str) -> tuple:
+        parts = []
+        last = 0
+        for match in WELCOME_PLACEHOLDER.finditer(text):
+            slot = self._slot(match)
+
+            # unknown placeholders stay in the text as they are
+            if slot is None:
+                continue
+
+            parts.append(text[last : match.start()])
+            parts.append(slot)
+            last = match.end()
+        parts.append(text[last:])
+
+        # merge all neighboring static parts
+        merged = []
+        for part in parts:
+            if isinstance(part, str) and merged and isinstance(merged[-1], str):
+                merged[-1] += part
+            elif part != "":
+                merged.append(part)
+        return tuple(merged) if merged else ("",)
+
+    def _slot(self, match):
+        """turn a placeholder into its static value or a slot that is filled on render"""
+        guild = self.guild
+        ctrl_char, ctrl_seq, ctrl_arg = match.group("ctrl_char", "ctrl_seq", "ctrl_arg")
+
+        if ctrl_char == "@":
+            user = guild.get_member_named(ctrl_seq)
+            if user is None:
+                return ("member_named", ctrl_seq, ctrl_arg, match.group(0))
+            return ("member", user.id, ctrl_arg, match.group(0))
+
+        elif ctrl_char == "#":
+            channel = discord.utils.get(guild.channels, name=ctrl_seq)
+            if channel is None:
+                return None
+            elif ctrl_arg == "id":
+                return str(channel.id)
+            elif ctrl_arg == "mention":
+                return channel.mention
+            else:
+                return channel.name
+
+        elif ctrl_char == "!":
+            role = discord.utils.get(guild.roles, name=ctrl_seq)
+            if role is None:
+                return None
+            elif ctrl_arg == "id":
+                return str(role.id)
+            elif ctrl_arg == "mention":
+                return role.mention
+            else:
+                return role.name
+
+        elif ctrl_seq == "server":
+            if ctrl_arg == "id":
+                return str(guild.id)
+            elif ctrl_arg == "icon":
+                return str(guild.icon_url)
+            else:
+                return guild.name
+
+        elif ctrl_seq == "user":
+            return ("user", ctrl_arg)
+
+        return None
+
+    async def resolve(self, members) -> None:
+        """look up all members of the template with the bot's MemberCache, so render doesn't have to wait"""
+        self.members = members
+        for key, parts in self.plan.items():
+            if isinstance(parts, str):
+                continue
+
+            resolved = []
+            for part in parts:
+                if isinstance(part, tuple) and part[0] == "member_named":
+                    user = await members.get_named(self.guild, part[1])
+
+                    # unknown members stay in the text as they are
+                    part = ("member", user.id, part[2], part[3]) if user else part[3]
+                elif isinstance(part, tuple) and part[0] == "member":
+                    await members.get(self.guild, part[1])
+                resolved.append(part)
+            self.plan[key] = tuple(resolved)
+
+    @staticmethod
+    def _member_value(member: discord.Member, arg: str) -> str:
+        if arg == "id":
+            return str(member.id)
+        elif arg == "icon":
+            return str(member.avatar_url)
+        elif arg == "mention":
+            return member.mention
+        else:
+            return member.display_name
+
+    def render(self, member: discord.Member) -> dict:
+        """fill in the slots for a joining member, returns a new welcome row"""
+        welcome = dict(self.source)
+        get_member = self.members.peek if self.members else lambda guild, member_id: guild.get_member(member_id)
+        for key, parts in self.plan.items():
+            if isinstance(parts, str):
+                welcome[key] = parts
+                continue
+
+            out = []
+            for part in parts:
+                if isinstance(part, str):
+                    out.append(part)
+                elif part[0] == "user":
+                    out.append(self._member_value(member, part[1]))
+                elif part[0] == "member":
+                    user = get_member(self.guild, part[1])
+                    out.append(self._member_value(user, part[2]) if user else part[3])
+                else:
+                    # not resolved yet
+                    out.append(part[3])
+            welcome[key] = "".join(out)
+        return welcome
+
+
 class WelcomeResponse(TextResponse):
     """
     This Represents a Discord Embed and any properties of that embed are active and usable by this class.
@@ -38,90 +237,8 @@ class WelcomeResponse(TextResponse):
     def __init__(self, welcome, bot: discord.Client, member: discord.Member):
         # properties
         self.channel = member.guild.get_channel(welcome["welcome_channel"])
+        self.welcome = WelcomeTemplate.get(welcome, member.guild).render(member)
 
-        # other variables
-        regex = re.compile(
-            r"{(?P<ctrl_char>[#@!]?)(?P<ctrl_seq>[\w\s]*)\.?(?P<ctrl_arg>\w*)}"
-        )
-        guild = member.guild
-
-        self.welcome = welcome
-
-        for key in self.welcome:
-            if not key in ("embed_color", "guild_id", "welcome_channel", "wait_pending") and not self.welcome[key] in (None, ""):
-                for match in regex.finditer(self.welcome[key]):
-                    group = match.groupdict()
-                    var = None  # must always be string or None
-
-                    if group["ctrl_char"] == "@":
-                        user_name = group["ctrl_seq"]
-                        user = guild.get_member_named(user_name)
-
-                        if group["ctrl_arg"] == "name":
-                            var = user.display_name
-                        elif group["ctrl_arg"] == "id":
-                            var = user.id
-                        elif group["ctrl_arg"] == "icon":
-                            var = user.avatar_url
-                        elif group["ctrl_arg"] == "mention":
-                            var = user.mention
-                        else:
-                            var = user.display_name
-                            
-
-                    elif group["ctrl_char"] == "#":
-                        channel_name = group["ctrl_seq"]
-                        channel = discord.utils.get(guild.channels, name=channel_name)
-
-                        if group["ctrl_arg"] == "name":
-                            var = channel.name
-                        elif group["ctrl_arg"] == "id":
-                            var = channel.id
-                        elif group["ctrl_arg"] == "mention":
-                            var = channel.mention
-                        else:
-                            var = channel.name
-
-                    elif group["ctrl_char"] == "!":
-                        role_name = group["ctrl_seq"]
-                        role = discord.utils.get(guild.roles, name=role_name)
-                        if group["ctrl_arg"] == "name":
-                            var = role.display_name
-                        elif group["ctrl_arg"] == "id":
-                            var = role.id
-                        elif group["ctrl_arg"] == "mention":
-                            var = role.mention
-                        else:
-                            var = role.name
-                    else:
-                        if group["ctrl_seq"] == "server":
-                            if group["ctrl_arg"] == "name":
-                                var = guild.name
-                            elif group["ctrl_arg"] == "id":
-                                var = guild.id
-                            elif group["ctrl_arg"] == "icon":
-                                var = guild.icon_url
-                            else:
-                                var = guild.name
-                        elif group["ctrl_seq"] == "user":
-                            if group["ctrl_arg"] == "name":
-                                var = member.display_name
-                            elif group["ctrl_arg"] == "id":
-                                var = member.id
-                            elif group["ctrl_arg"] == "icon":
-                                var = member.avatar_url
-                            elif group["ctrl_arg"] == "mention":
-                                var = member.mention
-                            else:
-                                var = member.display_name
-
-                    if not var == None:
-                        self.welcome[key] = (
-                            re.sub(regex.pattern, str(var), self.welcome[key], count=1)
-                            if not var == None
-                            else self.welcome[key]
-                        )
-                        
         super().__init__(self.welcome["embed_title"], color=self.welcome["embed_color"])
 
         if (
@@ -153,6 +270,12 @@ class WelcomeResponse(TextResponse):
         ):
             self.description = self.welcome["embed_description"]
 
+    @classmethod
+    async def create(cls, welcome, bot: discord.Client, member: discord.Member):
+        """create the welcome message, members the template mentions are fetched first if they aren't cached"""
+        await WelcomeTemplate.get(welcome, member.guild).resolve(bot.member_cache)
+        return cls(welcome, bot, member)
+
 
 class RateLimitResponse(TextResponse):
     """
@@ -3,10 +3,13 @@ import discord
 import asyncio
 import random
 import time
-import psycopg2
+import aiohttp
+import asyncpg
+import ijson
 
 
-from DemonOverlord.core.util.logger import LogMessage, LogType, LogFormat
+from DemonOverlord.core.util.logger import LogMessage, LogType, LogFormat, log
+from DemonOverlord.core.util import snapshot
 
 async def change_status(client: discord.Client) -> None:
     """
@@ -23,7 +26,7 @@ async def change_status(client: discord.Client) -> None:
 
             # log the action
             presence_type = str(presence.type).split(".")[1]
-            print(
+            log(
                 LogMessage(
                     f"Set Status \"{LogFormat.format(f'{presence_type} {presence.name}', LogFormat.BOLD)}\""
                 )
@@ -31,45 +34,113 @@ async def change_status(client: discord.Client) -> None:
         # sleep for 30 min and hand over control
         await asyncio.sleep(1800)
 
+async def update_ratelimits(client: discord.Client) -> None:
+    """
+    Keep the rate limiter in sync with the database: flush its counters and reload the custom limits.
+    this runs in the background, so the limiter itself never has to touch the database
+    """
+    await client.wait_until_done()
+    if client.local:
+        return
+
+    while True:
+        try:
+            await client.limiter.load_overrides(client.database)
+            await client.limiter.flush(client.database)
+        except Exception as e:
+            log(LogMessage(f"Syncing rate limits failed: {type(e).__name__}: {e}", msg_type=LogType.ERROR))
+        await asyncio.sleep(client.config.raw["ratelimits"]["flush_interval"])
+
+async def watch_config(client: discord.Client) -> None:
+    """
+    Reload the command config when one of its files changes. the files are only stat'ed,
+    they are read and parsed by the reload itself, off the event loop. config.json is only
+    read on startup, a change to it is logged but not applied
+    """
+    settings = client.config.raw["config_reload"]
+    if not settings["watch"]:
+        return
+
+    confdir = client.commands.confdir
+    last = snapshot.fingerprint(confdir, snapshot.COMMAND_SOURCES)
+    last_startup = snapshot.fingerprint(confdir, snapshot.STARTUP_SOURCES)
+    while True:
+        await asyncio.sleep(settings["interval"])
+        try:
+            current = snapshot.fingerprint(confdir, snapshot.COMMAND_SOURCES)
+            current_startup = snapshot.fingerprint(confdir, snapshot.STARTUP_SOURCES)
+        except OSError:
+            # editors may replace a file instead of writing it, try again next time
+            continue
+
+        if current_startup != last_startup:
+            last_startup = current_startup
+            log(
+                LogMessage(
+                    "config.json changed, restart the bot to apply it",
+                    msg_type=LogType.WARNING,
+                )
+            )
+
+        if current != last:
+            last = current
+            await client.reload_commands()
+
 async def fetch_steamdata(client: discord.Client):
+    """
+    Refresh the local steam catalog in the background. The whole applist is loaded in bulk
+    (see DatabaseConfig.update_steamdata), so a refresh takes seconds instead of hours.
+    """
     await client.wait_until_done()
     while True:
         if not client.local:
             # client in local mode means no database connection and therefore this is impossible
 
-            with client.database.connection_main.cursor() as cursor:
-                cursor.execute("SELECT * FROM public.api_refresh WHERE api_name=%s", [client.api.steam.name])
-                results = cursor.fetchall()
-                if len(results) == 0:
-                    print(LogMessage(f"API '{client.api.steam.name}' has not been used, creating entry..."))
-                    cursor.execute("INSERT INTO public.api_refresh (api_name, last_access) VALUES (%s, %s)", [client.api.steam.name, int(time.time())])
-                else: 
-                    if (int(time.time()) - results[0]["last_access"]) < 864000:
-                        LogMessage(f"API '{client.api.steam.name}' has been used within the last 24h, no update required.")
-                        return
-                    else:
-                        cursor.execute("UPDATE public.api_refresh SET last_access=%s WHERE api_name=%s", [int(time.time()), client.api.steam.name])
-                
-                appdata = await client.api.steam.get_appdata()
-                delay = 0.01
-                amount = len(appdata["applist"]["apps"])
-                print(LogMessage(f"inserting {amount} games into the database. this will take approximately {int((delay*amount)/3600)} hours"))
-                for app in appdata["applist"]["apps"]:
-                    if not app["name"] == "" and not app["appid"] == None:
-                        try:
-                            print(LogMessage(f"Trying to add game '{app['name']}' to local database."))
-                            url = f"https://steamcdn-a.akamaihd.net/steam/apps/{app['appid']}/header.jpg"
-                            storepage = f"https://store.steampowered.com/app/{app['appid']}"
-                            cursor.execute("INSERT INTO public.steam_data (appid, game_name, image_url, store_url) VALUES (%s, %s, %s, %s)", [app["appid"],app["name"],url, storepage ])
-
-                        except psycopg2.Error as e:
-                            print(LogMessage(f"Game '{app['name']}' already exists, skipping."))
-
-                        
-                        await asyncio.sleep(delay) # limit to one/ delay sec
-                    
+            try:
+                results = await client.database.pool.fetch("SELECT * FROM public.api_refresh WHERE api_name=$1", client.api.steam.name)
+                if len(results) > 0 and (int(time.time()) - results[0]["last_access"]) < 864000:
+                    log(LogMessage(f"API '{client.api.steam.name}' has been used recently, no update required."))
+                else:
+                    await update_steamdata(client, new_entry=len(results) == 0)
+            except (asyncpg.PostgresError, OSError, asyncio.TimeoutError) as e:
+                log(LogMessage(f"Steam refresh failed: {type(e).__name__}: {e}", msg_type=LogType.ERROR))
         else:
-            print(LogMessage(f"Running in local mode, cannot update information", msg_type=LogType.WARNING))
+            log(LogMessage(f"Running in local mode, cannot update information", msg_type=LogType.WARNING))
             return
-        # try every 5 hours
+        # try once a day
         await asyncio.sleep(3600*24)
+
+
+async def update_steamdata(client: discord.Client, new_entry: bool = False) -> None:
+    """Stream the steam applist and merge it into public.steam_data"""
+
+    async def records():
+        # empty entries are useless for lookups
+        async for appid, name in client.api.steam.iter_appdata():
+            if not name == "" and not appid == None:
+                yield (
+                    appid,
+                    name[:256],
+                    f"https://store.steampowered.com/app/{appid}",
+                    f"https://steamcdn-a.akamaihd.net/steam/apps/{appid}/header.jpg",
+                )
+
+    start = time.monotonic()
+    log(LogMessage("Merging the steam catalog into the database."))
+    try:
+        changed = await client.database.update_steamdata(records())
+    except (AssertionError, aiohttp.ClientError, ijson.JSONError, asyncio.TimeoutError, asyncpg.PostgresError) as e:
+        # a failed refresh is tried again tomorrow, it must not end the service
+        log(LogMessage(f"Getting steam appdata failed: {type(e).__name__}", msg_type=LogType.ERROR))
+        return
+    log(LogMessage(f"Steam catalog updated, {changed} games added or changed in {time.monotonic() - start:.2f}s."))
+
+    # cached lookups may be stale now
+    client.api.steam.games.clear()
+
+    # only mark the API as used once the data is actually in
+    if new_entry:
+        log(LogMessage(f"API '{client.api.steam.name}' has not been used, creating entry..."))
+        await client.database.pool.execute("INSERT INTO public.api_refresh (api_name, last_access) VALUES ($1, $2)", client.api.steam.name, int(time.time()))
+    else:
+        await client.database.pool.execute("UPDATE public.api_refresh SET last_access=$1 WHERE api_name=$2", int(time.time()), client.api.steam.name)
@@ -0,0 +1,138 @@
+import asyncio
+import time
+
+import discord
+
+from DemonOverlord.core.util.logger import LogMessage, LogType, log
+
+
+class Session(object):
+    """
+    This is a single interactive session, like a running game or a confirmation prompt.
+    Events routed to it are put into its queue, the owning handler reads them with `wait()`.
+    """
+
+    __slots__ = ("router", "channel_id", "user_id", "message_id", "check", "queue")
+
+    def __init__(self, router, channel_id: int, user_id: int, message_id: int = None, check=None):
+        self.router = router
+        self.channel_id = channel_id
+        self.user_id = user_id
+        self.message_id = message_id
+        self.check = check
+        self.queue = asyncio.Queue()
+
+    async def wait(self, timeout: float = None):
+        """wait for the next event of this session, raises asyncio.TimeoutError after `timeout` seconds"""
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+    def close(self) -> None:
+        self.router.close(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class SessionRouter(object):
+    """
+    This is the central router for all interactive sessions. Instead of running a check for every
+    pending `wait_for` on every event, sessions are indexed by (channel_id, user_id) for messages
+    and by message_id for reactions, so each event costs a single dict lookup.
+    """
+
+    def __init__(self):
+        self.messages = dict()
+        self.reactions = dict()
+
+    def open(self, channel_id: int, user_id: int, message_id: int = None, check=None) -> Session:
+        """
+        open a session for a user in a channel. messages of that user in that channel are routed to it,
+        unless `message_id` is given, then only the user's reactions to that message are routed to it.
+        a newer session for the same key replaces the older one.
+        """
+        session = Session(self, channel_id, user_id, message_id=message_id, check=check)
+        if message_id is None:
+            self.messages[(channel_id, user_id)] = session
+        else:
+            self.reactions[message_id] = session
+        return session
+
+    def close(self, session: Session) -> None:
+        """remove a session from the indices, unless it was already replaced"""
+        if session.message_id is None:
+            key = (session.channel_id, session.user_id)
+            if self.messages.get(key) is session:
+                del self.messages[key]
+        elif self.reactions.get(session.message_id) is session:
+            del self.reactions[session.message_id]
+
+    def dispatch_message(self, message) -> bool:
+        """route a message to its session. returns True if a session consumed it"""
+        session = self.messages.get((message.channel.id, message.author.id))
+        if session is None or (session.check is not None and not session.check(message)):
+            return False
+
+        session.queue.put_nowait(message)
+        return True
+
+    def dispatch_reaction(self, reaction, user) -> bool:
+        """route a reaction to its session. returns True if a session consumed it"""
+        session = self.reactions.get(reaction.message.id)
+        if session is None or user.id != session.user_id:
+            return False
+        if session.check is not None and not session.check(reaction, user):
+            return False
+
+        session.queue.put_nowait((reaction, user))
+        return True
+
+    def __len__(self) -> int:
+        return len(self.messages) + len(self.reactions)
+
+
+class EditCoalescer(object):
+    """
+    This merges frequent edits of a message. The first update is sent right away, updates within `delay`
+    seconds of the last edit are merged into one edit, which always shows the latest state from `render()`.
+    """
+
+    def __init__(self, message: discord.Message, render, delay: float = 1.0):
+        self.message = message
+        self.render = render
+        self.delay = delay
+        self._last = 0
+        self._pending = False
+        self._task = None
+
+    def update(self) -> None:
+        """mark the message as outdated, the edit is sent in the background"""
+        self._pending = True
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+
+    async def _run(self) -> None:
+        while self._pending:
+            wait = self._last + self.delay - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+            # everything up to here is part of this edit
+            self._pending = False
+            self._last = time.monotonic()
+            try:
+                await self.message.edit(embed=self.render())
+            except discord.HTTPException as e:
+                log(LogMessage(f"Failed to edit message: {e}", msg_type=LogType.WARNING))
+
+    async def close(self) -> None:
+        """drop all pending edits, e.g. before the message is deleted"""
+        self._pending = False
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
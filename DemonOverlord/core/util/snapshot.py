@@ -0,0 +1,359 @@
+"""
+Precompiled config snapshots. The config files are validated against DemonOverlord/config/json_templates once,
+the parsed files and everything derived from them are written to a single snapshot, keyed by the hash of all
+source files. The snapshot also stores the modification time and size of every source file, as long as those
+match, startup only loads the snapshot and never reads or validates the source files.
+
+usage:
+    python -m DemonOverlord.core.util.snapshot            validate the config and build the snapshot
+    python -m DemonOverlord.core.util.snapshot --check    only validate the config
+"""
+import argparse
+import hashlib
+import os
+import sys
+import ujson as json
+
+from DemonOverlord.core.util.logger import LOG_LEVELS
+
+
+# bump this when the layout of the snapshot changes, old snapshots are rebuilt
+SNAPSHOT_VERSION = 2
+SNAPSHOT_FILE = ".config_snapshot.json"
+
+# all files a snapshot is built from, relative to the config directory
+SOURCES = (
+    "config.json",
+    "cmd_info.json",
+    "interactions.json",
+    "special/izzy.json",
+    "json_templates/config.json",
+    "json_templates/config/bot_mode.json",
+    "json_templates/config/shard_layout.json",
+    "json_templates/config/intent_profile.json",
+    "json_templates/config/status_message.json",
+    "json_templates/help/category.json",
+    "json_templates/help/command.json",
+    "json_templates/help/actions.json",
+    "json_templates/help/params.json",
+    "json_templates/interactions/alone_interaction.json",
+    "json_templates/interactions/social_interactions.json",
+    "json_templates/interactions/combine_interactions.json",
+)
+
+# the files that are only read on startup, changing them needs a restart
+STARTUP_SOURCES = tuple(name for name in SOURCES if name == "config.json" or name.startswith("json_templates/config"))
+
+# the files of the command config, these can be reloaded while the bot is running (see DemonOverlord.reload_commands)
+COMMAND_SOURCES = tuple(name for name in SOURCES if name not in STARTUP_SOURCES)
+
+# the templates of list entries and of objects keyed by name, the templates themselves only contain empty ones.
+# nested keys map to a dict of their own
+TEMPLATE_ITEMS = {
+    "config": {
+        "cli_options": {"bot_modes": "config/bot_mode", "shard_layouts": "config/shard_layout"},
+        "intent_profiles": "config/intent_profile",
+        "status_messages": "config/status_message",
+    },
+    "help/category": {"commands": "help/command"},
+    "help/command": {"actions": "help/actions"},
+    "help/actions": {"params": "help/params"},
+}
+
+# the values the bot knows for some config.json keys
+LOG_FORMATS = ("console", "json")
+ACTIVITY_TYPES = ("playing", "streaming", "listening", "watching", "competing")
+
+# the url of the joking vecter promo, see the status messages in config.json
+VECTER_URL = "https://www.youtube.com/watch?v=dBRSjTKdtrI"
+
+# the snapshot this process loaded last, by config directory and fingerprint
+_loaded = dict()
+
+
+class ConfigError(Exception):
+    """This is raised when a config file doesn't match its template"""
+
+    def __init__(self, errors: list):
+        self.errors = errors
+        super().__init__("invalid config:\n" + "\n".join(f"    {error}" for error in errors))
+
+
+def _validate(value, template, path: str, errors: list, templates: dict, name: str = None, items: dict = None) -> None:
+    """
+    check `value` against `template`. every key of a template is required, extra keys are allowed.
+    the type of a template value is the expected type, null accepts anything and lists may be null (no entries).
+    the entries of lists and objects listed in TEMPLATE_ITEMS are checked against their own template
+    """
+    if items is None:
+        items = TEMPLATE_ITEMS.get(name, {})
+
+    if template is None:
+        return
+
+    if isinstance(template, dict):
+        if not isinstance(value, dict):
+            errors.append(f"{path}: expected an object, got {type(value).__name__}")
+            return
+        for key, expected in template.items():
+            if key not in value:
+                errors.append(f"{path}: missing key '{key}'")
+                continue
+
+            item_name = items.get(key)
+            if isinstance(item_name, dict):
+                _validate(value[key], expected, f"{path}.{key}", errors, templates, items=item_name)
+            elif item_name and isinstance(value[key], list):
+                for index, item in enumerate(value[key]):
+                    _validate(item, templates[item_name], f"{path}.{key}[{index}]", errors, templates, item_name)
+            elif item_name and isinstance(value[key], dict):
+                for entry, item in value[key].items():
+                    _validate(item, templates[item_name], f"{path}.{key}.{entry}", errors, templates, item_name)
+            else:
+                _validate(value[key], expected, f"{path}.{key}", errors, templates)
+
+    elif isinstance(template, list):
+        if value is not None and not isinstance(value, list):
+            errors.append(f"{path}: expected a list, got {type(value).__name__}")
+
+    elif isinstance(template, bool):
+        if not isinstance(value, bool):
+            errors.append(f"{path}: expected a boolean, got {type(value).__name__}")
+
+    elif isinstance(template, (int, float)):
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            errors.append(f"{path}: expected a number, got {type(value).__name__}")
+
+    elif isinstance(template, str):
+        if not isinstance(value, str):
+            errors.append(f"{path}: expected a string, got {type(value).__name__}")
+
+
+def validate(files: dict) -> None:
+    """validate the parsed config files against their templates, raises a ConfigError with every problem found"""
+    templates = {
+        name[len("json_templates/") : -len(".json")]: content
+        for name, content in files.items()
+        if name.startswith("json_templates/")
+    }
+    errors = []
+
+    config = files["config.json"]
+    _validate(config, templates["config"], "config.json", errors, templates, "config")
+    if not errors:
+        _validate_config(config, errors)
+
+    for category, info in files["cmd_info.json"].items():
+        _validate(info, templates["help/category"], f"cmd_info.json:{category}", errors, templates, "help/category")
+
+    interaction_templates = {
+        "alone": "interactions/alone_interaction",
+        "social": "interactions/social_interactions",
+        "combine": "interactions/combine_interactions",
+    }
+    interactions = files["interactions.json"]
+    for category, template in interaction_templates.items():
+        if category not in interactions:
+            errors.append(f"interactions.json: missing category '{category}'")
+            continue
+        for action, info in interactions[category].items():
+            _validate(info, templates[template], f"interactions.json:{category}.{action}", errors, templates)
+
+    for category, links in files["special/izzy.json"].items():
+        for index, link in enumerate(links):
+            _validate(link, {"name": "", "link": ""}, f"special/izzy.json:{category}[{index}]", errors, templates)
+
+    # short commands must be unique, the first one would be shadowed
+    shorts = dict()
+    for info in files["cmd_info.json"].values():
+        for command in info["commands"] if isinstance(info.get("commands"), list) else []:
+            short = command.get("short") if isinstance(command, dict) else None
+            if short is not None and not isinstance(short, str):
+                errors.append(f"cmd_info.json: short of '{command.get('command')}' must be a string or null")
+            elif short and short in shorts:
+                errors.append(f"cmd_info.json: short '{short}' is used by '{shorts[short]}' and '{command['command']}'")
+            elif short:
+                shorts[short] = command["command"]
+
+    if errors:
+        raise ConfigError(errors)
+
+
+def _validate_config(config: dict, errors: list) -> None:
+    """the checks on config.json a template can't express"""
+    levels = {level for level, _ in LOG_LEVELS.values()}
+    if config["logging"]["level"].upper() not in levels:
+        errors.append(f"config.json.logging.level: unknown level '{config['logging']['level']}'")
+
+    for flag, mode in config["cli_options"]["bot_modes"].items():
+        path = f"config.json.cli_options.bot_modes.{flag}"
+        if mode["log_format"] not in LOG_FORMATS:
+            errors.append(f"{path}.log_format: expected one of {', '.join(LOG_FORMATS)}")
+        if mode["intent_profile"] not in config["intent_profiles"]:
+            errors.append(f"{path}.intent_profile: unknown profile '{mode['intent_profile']}'")
+
+    for flag, layout in config["cli_options"]["shard_layouts"].items():
+        count = layout["shard_count"]
+        if count is not None and (isinstance(count, bool) or not isinstance(count, int)):
+            errors.append(f"config.json.cli_options.shard_layouts.{flag}.shard_count: expected a number or null")
+
+    for index, message in enumerate(config["status_messages"] or ()):
+        if message["type"] not in ACTIVITY_TYPES:
+            errors.append(f"config.json.status_messages[{index}].type: unknown activity type '{message['type']}'")
+
+
+def derive(files: dict) -> dict:
+    """everything BotConfig and CommandConfig compute from the config files"""
+    command_info = files["cmd_info.json"]
+    commands = []
+    short = dict()
+
+    # load in the command list and update the short commands
+    for category in command_info.values():
+        for command in category["commands"]:
+            commands.append(command)
+            if command["short"]:
+                short[command["short"]] = command["command"]
+
+    # generate the ratelimit for all interactions
+    commands.append({"command": "interactions", "ratelimit": command_info["interactions"]["ratelimit"]})
+
+    # the status messages, ready to be turned into activities
+    activities = [
+        {
+            "name": message["content"],
+            "type": message["type"],
+            "url": VECTER_URL if "Vecter" in message["content"] else None,
+        }
+        for message in files["config.json"]["status_messages"] or ()
+    ]
+
+    return {"list": commands, "short": short, "activities": activities}
+
+
+def _hash(sources: dict, names: tuple) -> str:
+    digest = hashlib.sha256(str(SNAPSHOT_VERSION).encode())
+    for name in names:
+        digest.update(name.encode())
+        digest.update(sources[name])
+    return digest.hexdigest()
+
+
+def _read_sources(confdir: str) -> tuple:
+    """the raw content of all source files and their combined hash"""
+    sources = dict()
+    for name in SOURCES:
+        with open(os.path.join(confdir, name), "rb") as f:
+            sources[name] = f.read()
+    return sources, _hash(sources, SOURCES)
+
+
+def fingerprint(confdir: str, names: tuple = SOURCES) -> tuple:
+    """the modification time and size of the source files, a cheap way to notice changes"""
+    stats = [os.stat(os.path.join(confdir, name)) for name in names]
+    return tuple((stat.st_mtime_ns, stat.st_size) for stat in stats)
+
+
+def build(confdir: str, sources: dict = None, content_hash: str = None, stats: tuple = None) -> dict:
+    """parse and validate all config files and write the snapshot, returns the snapshot"""
+    if sources is None:
+        # stat first, a file that changes while it is read is noticed on the next load
+        stats = fingerprint(confdir)
+        sources, content_hash = _read_sources(confdir)
+
+    files = dict()
+    for name, raw in sources.items():
+        try:
+            files[name] = json.loads(raw)
+        except ValueError as e:
+            raise ConfigError([f"{name}: {e}"])
+    validate(files)
+
+    snapshot = {
+        "version": SNAPSHOT_VERSION,
+        "fingerprint": [list(stat) for stat in stats],
+        "hash": content_hash,
+        "command_hash": _hash(sources, COMMAND_SOURCES),
+        "config": files["config.json"],
+        "interactions": files["interactions.json"],
+        "command_info": files["cmd_info.json"],
+        "izzylinks": files["special/izzy.json"],
+        **derive(files),
+    }
+
+    _write(confdir, snapshot)
+    return snapshot
+
+
+def _write(confdir: str, snapshot: dict) -> None:
+    try:
+        with open(os.path.join(confdir, SNAPSHOT_FILE), "w") as f:
+            json.dump(snapshot, f, ensure_ascii=False, escape_forward_slashes=False)
+    except OSError:
+        # a read only config directory means validating on every start
+        pass
+
+
+def load(confdir: str) -> dict:
+    """
+    load the snapshot of the config directory. the source files are only stat'ed, they are read, hashed
+    and validated again if their modification time or size changed
+    """
+    stats = fingerprint(confdir)
+    key = (confdir, stats)
+    if key in _loaded:
+        return _loaded[key]
+
+    snapshot = None
+    try:
+        with open(os.path.join(confdir, SNAPSHOT_FILE)) as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError):
+        pass
+
+    if snapshot is not None and snapshot.get("version") != SNAPSHOT_VERSION:
+        snapshot = None
+
+    current = [list(stat) for stat in stats]
+    if snapshot is None or snapshot.get("fingerprint") != current:
+        sources, content_hash = _read_sources(confdir)
+
+        # touched, but not changed: the snapshot is still valid
+        if snapshot is not None and snapshot.get("hash") == content_hash:
+            snapshot["fingerprint"] = current
+            _write(confdir, snapshot)
+        else:
+            snapshot = build(confdir, sources, content_hash, stats)
+
+    # only the current snapshot is kept, older ones are outdated
+    _loaded.clear()
+    _loaded[key] = snapshot
+    return snapshot
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description="validate the config files and build the config snapshot")
+    parser.add_argument(
+        "--confdir",
+        default=os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "config"),
+        help="the config directory",
+    )
+    parser.add_argument("--check", action="store_true", help="only validate, don't write the snapshot")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.check:
+            sources, _ = _read_sources(args.confdir)
+            validate({name: json.loads(raw) for name, raw in sources.items()})
+            print("config is valid")
+        else:
+            snapshot = build(args.confdir)
+            print(f"snapshot {snapshot['hash'][:12]} written to {os.path.join(args.confdir, SNAPSHOT_FILE)}")
+    except (ConfigError, ValueError) as e:
+        print(e, file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,239 @@
+"""
+Offline microbenchmarks for the command hot path. Nothing here needs discord, the database or network access,
+the real command code runs against the fakes in benchmarks/fakes.py.
+
+usage:
+    python -m benchmarks.bench                  run all benchmarks and compare them to the baseline
+    python -m benchmarks.bench --save           run all benchmarks and store the results as the new baseline
+    python -m benchmarks.bench -k interactions  only run benchmarks containing "interactions"
+
+The baseline is machine specific, so it is not checked in. Compare runs on the same machine only.
+"""
+import argparse
+import asyncio
+import os
+import platform
+import statistics
+import sys
+import time
+import ujson as json
+
+from DemonOverlord.core.util.command import Command
+from DemonOverlord.core.util.responses import WelcomeResponse
+from DemonOverlord.core.modules import help, interactions, minesweeper
+from benchmarks.fakes import FakeBot
+
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+
+class Benchmark(object):
+    """
+    This is a single benchmark. `func` is called (and awaited, if it is a coroutine function) once per operation.
+    The time per operation is measured over several rounds, the median of all rounds is reported.
+    """
+
+    def __init__(self, name: str, func, rounds: int = 7, min_time: float = 0.1):
+        self.name = name
+        self.func = func
+        self.rounds = rounds
+        self.min_time = min_time
+        self.is_async = asyncio.iscoroutinefunction(func)
+
+    async def _run_async(self, number: int) -> float:
+        func = self.func
+        start = time.perf_counter()
+        for _ in range(number):
+            await func()
+        return time.perf_counter() - start
+
+    def _run(self, number: int, loop) -> float:
+        if self.is_async:
+            return loop.run_until_complete(self._run_async(number))
+
+        func = self.func
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        return time.perf_counter() - start
+
+    def measure(self, loop) -> dict:
+        # find a number of operations that takes at least `min_time` per round
+        number = 1
+        while True:
+            elapsed = self._run(number, loop)
+            if elapsed >= self.min_time:
+                break
+            number *= 10 if elapsed < self.min_time / 10 else 2
+
+        timings = [self._run(number, loop) / number for _ in range(self.rounds)]
+        return {
+            "median_us": statistics.median(timings) * 1e6,
+            "min_us": min(timings) * 1e6,
+            "stdev_us": statistics.stdev(timings) * 1e6 if len(timings) > 1 else 0.0,
+            "number": number,
+        }
+
+
+def cycle(items: list):
+    """returns a function, that hands out the elements of `items` one after another, starting over at the end"""
+    state = {"index": 0}
+
+    def next_item():
+        item = items[state["index"]]
+        state["index"] = (state["index"] + 1) % len(items)
+        return item
+
+    return next_item
+
+
+def collect(bot: FakeBot) -> list:
+    """all benchmarks of the suite"""
+    prefix = bot.config.mode["prefix"]
+    guild = bot.guild
+    author = guild.members[1]
+    mentions = guild.members[2:4]
+    benchmarks = []
+
+    # command parsing
+    plain = bot.message(f"{prefix} help izzy")
+    interaction = bot.message(f"{prefix} hug {mentions[0].mention} have a nice day", mentions=mentions[:1])
+    benchmarks.append(Benchmark("command.parse.plain", lambda: Command(bot, plain)))
+    benchmarks.append(Benchmark("command.parse.interaction", lambda: Command(bot, interaction)))
+
+    # interaction embeds, every benchmark cycles through all actions of its category
+    for category in ("alone", "social", "combine"):
+        messages = []
+        for action in bot.commands.interactions[category]:
+            if category == "alone":
+                messages.append(bot.message(f"{prefix} {action}", author))
+            else:
+                messages.append(
+                    bot.message(f"{prefix} {action} {mentions[0].mention} {mentions[1].mention} hi", author, mentions)
+                )
+        next_message = cycle(messages)
+
+        async def run_interaction(next_message=next_message):
+            await interactions.handler(Command(bot, next_message()))
+
+        benchmarks.append(Benchmark(f"interactions.{category}", run_interaction))
+
+    # help pages: main page, every category and every command
+    help_messages = [bot.message(f"{prefix} help")]
+    help_messages += [bot.message(f"{prefix} help {category}") for category in bot.commands.command_info]
+    help_messages += [
+        bot.message(f"{prefix} help {command['command']}") for command in bot.commands.list if "actions" in command
+    ]
+    next_help = cycle(help_messages)
+
+    async def run_help():
+        await help.handler(Command(bot, next_help()))
+
+    benchmarks.append(Benchmark("help.all_pages", run_help))
+
+    # welcome message with a placeholder of every kind
+    welcome = {
+        "guild_id": guild.id,
+        "welcome_channel": guild.channels[0].id,
+        "embed_color": 0xE2268F,
+        "wait_pending": False,
+        "embed_title": "Welcome {user.name} to {server}!",
+        "embed_description": (
+            "Hi {user.mention}, please read {#channel-1.mention} and {#channel-2.mention}. "
+            "Ping {!role 1.mention} or {@member 3.mention} if you need help."
+        ),
+        "embed_image": "https://media1.tenor.com/images/offline/tenor.gif",
+        "embed_thumbnail": "{user.icon}",
+        "embed_author": "{server.name}",
+        "embed_author_img": "{server.icon}",
+    }
+    benchmarks.append(Benchmark("welcome.render", lambda: WelcomeResponse(welcome, bot, author)))
+
+    # minesweeper, a renderer owns the dirty rows of its board, so every renderer gets its own board
+    benchmarks.append(Benchmark("minesweeper.generate_game", minesweeper.generate_game))
+    benchmarks.append(
+        Benchmark(
+            "minesweeper.render.full",
+            lambda: minesweeper.GridRenderer(bot, minesweeper.generate_game()).render(),
+        )
+    )
+
+    board = minesweeper.generate_game()
+    renderer = minesweeper.GridRenderer(bot, board)
+
+    def move():
+        board.flag(0, 0)
+        renderer.render()
+
+    benchmarks.append(Benchmark("minesweeper.render.move", move))
+    return benchmarks
+
+
+def report(results: dict, baseline: dict, threshold: float) -> int:
+    """print all results next to the baseline, returns the number of regressions"""
+    regressions = 0
+    width = max(len(name) for name in results)
+
+    print(f"{'benchmark': <{width}}  {'baseline': >12}  {'current': >12}  {'change': >8}")
+    for name, result in results.items():
+        current = result["median_us"]
+        if name in baseline:
+            before = baseline[name]["median_us"]
+            change = (current - before) / before
+            marker = ""
+            if change > threshold:
+                marker = "  REGRESSION"
+                regressions += 1
+            elif change < -threshold:
+                marker = "  improved"
+            print(f"{name: <{width}}  {before: >10.2f}us  {current: >10.2f}us  {change: >+7.1%}{marker}")
+        else:
+            print(f"{name: <{width}}  {'-': >12}  {current: >10.2f}us  {'new': >8}")
+    return regressions
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description="offline microbenchmarks for the command hot path")
+    parser.add_argument("--save", action="store_true", help="store the results as the new baseline")
+    parser.add_argument("--baseline", default=BASELINE, help="path of the baseline file")
+    parser.add_argument("--threshold", type=float, default=0.1, help="relative slowdown reported as regression")
+    parser.add_argument("-k", dest="keyword", default=None, help="only run benchmarks containing this string")
+    args = parser.parse_args(argv)
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    bot = FakeBot()
+    results = dict()
+    for benchmark in collect(bot):
+        if args.keyword and args.keyword not in benchmark.name:
+            continue
+        results[benchmark.name] = benchmark.measure(loop)
+    loop.close()
+
+    baseline = dict()
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+
+    regressions = report(results, baseline, args.threshold)
+
+    if args.save:
+        with open(args.baseline, "w") as f:
+            json.dump(
+                {
+                    "python": sys.version.split()[0],
+                    "platform": platform.platform(),
+                    "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                    "results": results,
+                },
+                f,
+                indent=4,
+            )
+        print(f"baseline saved to {args.baseline}")
+
+    return 1 if regressions and not args.save else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,251 @@
+"""
+Lightweight stand-ins for the discord.py objects the bot touches, so the real command code can run
+without a connection to discord, the database or any api.
+"""
+import asyncio
+import itertools
+import os
+import random
+import ujson as json
+
+from DemonOverlord.core.util.config import BotConfig, CommandConfig
+from DemonOverlord.core.util.command import CommandRegistry
+from DemonOverlord.core.util.ratelimit import RateLimiter
+from DemonOverlord.core.util.sessions import SessionRouter
+from DemonOverlord.core.util.members import MemberCache
+
+
+CONFDIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "DemonOverlord", "config")
+
+# discord ids are unique, fake ones only have to be unique per run
+_ids = itertools.count(100000000000000000)
+
+
+class FakeTransport(object):
+    """
+    This is a stand-in for discord's REST api. Every request (send, edit, delete, ...) is counted
+    and takes `latency` seconds, plus up to `jitter` seconds.
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.requests = dict()
+
+    def count(self, kind: str) -> None:
+        self.requests[kind] = self.requests.get(kind, 0) + 1
+
+    async def request(self, kind: str) -> None:
+        self.count(kind)
+        delay = self.latency + (random.random() * self.jitter if self.jitter else 0)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+async def _request(guild, kind: str) -> None:
+    if guild.transport is not None:
+        await guild.transport.request(kind)
+
+
+class FakeTyping(object):
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return False
+
+
+class FakePermissions(object):
+    def __init__(self, value: bool = True):
+        self.administrator = value
+        self.manage_guild = value
+        self.send_messages = value
+
+
+class FakeRole(object):
+    def __init__(self, guild, name: str):
+        self.id = next(_ids)
+        self.guild = guild
+        self.name = name
+        self.mention = f"<@&{self.id}>"
+
+
+class FakeMember(object):
+    def __init__(self, guild, name: str, *, bot: bool = False, pending: bool = False):
+        self.id = next(_ids)
+        self.guild = guild
+        self.name = name
+        self.display_name = name
+        self.nick = None
+        self.mention = f"<@!{self.id}>"
+        self.avatar_url = f"https://cdn.discordapp.com/avatars/{self.id}/avatar.png"
+        self.bot = bot
+        self.pending = pending
+        self.activities = []
+        self.roles = []
+        self.guild_permissions = FakePermissions()
+
+    async def add_roles(self, *roles, reason=None, atomic=True):
+        await _request(self.guild, "add_roles")
+        self.roles.extend(roles)
+
+
+class FakeMessage(object):
+    def __init__(self, channel, author, content: str, mentions: list = None):
+        self.id = next(_ids)
+        self.channel = channel
+        self.guild = channel.guild
+        self.author = author
+        self.content = content
+        self.mentions = mentions or []
+        self.channel_mentions = []
+        self.reference = None
+        self.embed = None
+
+    async def edit(self, *, embed=None, **kwargs):
+        await _request(self.guild, "edit")
+        self.embed = embed
+
+    async def delete(self, *, delay=None):
+        # delayed deletes don't block the caller, like in discord.py
+        if delay:
+            if self.guild.transport is not None:
+                self.guild.transport.count("delete_delayed")
+        else:
+            await _request(self.guild, "delete")
+
+    async def add_reaction(self, emoji):
+        await _request(self.guild, "add_reaction")
+
+
+class FakeChannel(object):
+    def __init__(self, guild, name: str):
+        self.id = next(_ids)
+        self.guild = guild
+        self.name = name
+        self.mention = f"<#{self.id}>"
+        self.sent = 0
+
+    def typing(self):
+        return FakeTyping()
+
+    def permissions_for(self, member):
+        return FakePermissions()
+
+    async def send(self, content=None, *, embed=None, reference=None, **kwargs):
+        await _request(self.guild, "send")
+        self.sent += 1
+        message = FakeMessage(self, self.guild.me, content or "")
+        message.embed = embed
+        return message
+
+
+class FakeGuild(object):
+    def __init__(
+        self, name: str = "InnerDemons", members: int = 50, channels: int = 10, roles: int = 10, transport=None
+    ):
+        self.id = next(_ids)
+        self.name = name
+        self.transport = transport
+        self.icon_url = f"https://cdn.discordapp.com/icons/{self.id}/icon.png"
+        self.me = FakeMember(self, "DemonOverlord", bot=True)
+        self.members = [self.me] + [FakeMember(self, f"member {i}") for i in range(members)]
+        self.channels = [FakeChannel(self, f"channel-{i}") for i in range(channels)]
+        self.roles = [FakeRole(self, f"role {i}") for i in range(roles)]
+        self._members = {member.id: member for member in self.members}
+
+    def get_member(self, member_id: int):
+        return self._members.get(member_id)
+
+    def get_member_named(self, name: str):
+        return next((member for member in self.members if member.name == name), None)
+
+    def get_channel(self, channel_id: int):
+        return next((channel for channel in self.channels if channel.id == channel_id), None)
+
+    def get_role(self, role_id: int):
+        return next((role for role in self.roles if role.id == role_id), None)
+
+
+class FakeTenorAPI(object):
+    async def get_interact(self, name: str) -> str:
+        return "https://media1.tenor.com/images/offline/tenor.gif"
+
+
+class FakeSteamAPI(object):
+    async def get_gamedata(self, bot, game: str) -> dict:
+        return None
+
+
+class FakeAPIConfig(object):
+    """This replaces APIConfig, the APIs answer right away and there is no session to open or close"""
+
+    def __init__(self, config=None):
+        self.tenor = FakeTenorAPI()
+        self.steam = FakeSteamAPI()
+
+    async def connect(self) -> None:
+        pass
+
+    async def close_connections(self) -> None:
+        pass
+
+
+class FakeBot(object):
+    """
+    This has the same configuration as the real bot, loaded from DemonOverlord/config, but no connections.
+    It runs in local mode, so nothing tries to reach the database.
+    """
+
+    def __init__(self, argv: list = None):
+        # BotConfig needs a token, even though it is never used
+        with open(os.path.join(CONFDIR, "config.json")) as f:
+            env = json.load(f)["env_vars"]["discord"]
+        for name in env.values():
+            os.environ.setdefault(name, "offline")
+
+        self.config = BotConfig(self, CONFDIR, argv or ["run.py", "--dev"])
+        self.config.post_connect(self)
+        self.commands = CommandConfig(CONFDIR, self.config.izzymojis)
+        self.registry = CommandRegistry(self.commands)
+        self.intents = self.config.client_options(self.registry.intents, self.registry.optional_intents)["intents"]
+        self.limiter = RateLimiter(self.commands)
+        self.sessions = SessionRouter()
+        self.member_cache = MemberCache()
+        self.api = FakeAPIConfig()
+        self.database = None
+        self.local = True
+
+        self.guild = FakeGuild()
+        self.user = self.guild.me
+
+    def get_emoji(self, emoji_id: int):
+        return None
+
+    def message(self, content: str, author: FakeMember = None, mentions: list = None) -> FakeMessage:
+        """a message in the first channel of the fake guild, by default from its first member"""
+        author = author or self.guild.members[1]
+        return FakeMessage(self.guild.channels[0], author, content, mentions=mentions)
+
+
+class FakePool(object):
+    """
+    This is a stand-in for the asyncpg pool of DatabaseConfig, so the real settings queries and their cache run.
+    It knows a welcome message and an autorole per guild, every query goes through the transport
+    and takes the configured latency.
+    """
+
+    def __init__(self, transport: FakeTransport = None):
+        self.transport = transport
+        self.welcome = dict()
+        self.autorole = dict()
+
+    async def fetchrow(self, query: str, guild_id: int):
+        if self.transport is not None:
+            await self.transport.request("database")
+
+        if "admin.welcome_messages" in query:
+            return self.welcome.get(guild_id)
+        elif "admin.autoroles" in query:
+            return self.autorole.get(guild_id)
+        raise NotImplementedError(f"the fake pool can't answer: {query}")
@@ -0,0 +1,279 @@
+"""
+Load generator for the real bot code path. A DemonOverlord instance is created without a gateway connection,
+events are fed into its on_message, on_member_join and on_member_update handlers at a fixed rate and all
+REST requests and database queries go to a local stand-in with configurable latency.
+
+usage:
+    python -m benchmarks.loadtest --rate 200 --duration 30 --latency 50
+    python -m benchmarks.loadtest --save-trace trace.jsonl     store the generated events
+    python -m benchmarks.loadtest --trace trace.jsonl          replay stored (or recorded) events
+
+Traces are json lines: {"at": seconds since start, "event": "message" | "join" | "update", "content": "..."}
+Messages are sent by a random member, joins and updates use a new member each.
+
+The report shows the sustained throughput, p50/p99 latency per event from its scheduled time
+until the handler finished (so slow handlers can't hide queued events) and the event loop lag.
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+import ujson as json
+
+from DemonOverlord.core.util.logger import logger
+from benchmarks.fakes import (
+    CONFDIR,
+    FakeAPIConfig,
+    FakePool,
+    FakeGuild,
+    FakeMember,
+    FakeMessage,
+    FakeTransport,
+)
+
+
+def percentile(values: list, share: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(share * len(values)))]
+
+
+def create_bot(guild: FakeGuild, transport: FakeTransport):
+    """create the real bot, without any connection to discord, the database or an api"""
+    with open(os.path.join(CONFDIR, "config.json")) as f:
+        env = json.load(f)["env_vars"]
+
+    # the load test must never reach a real database or api
+    for name in env["discord"].values():
+        os.environ.setdefault(name, "offline")
+    for name in list(env["postgres"].values()) + [env["tenor"]["token"]]:
+        os.environ.pop(name, None)
+
+    import DemonOverlord.core.demonoverlord as core
+    from DemonOverlord.core.util import snapshot
+    from DemonOverlord.core.util.config import DatabaseConfig
+
+    # no metrics server and no http session, BotConfig reads the config this process already loaded
+    workdir = os.path.dirname(CONFDIR)
+    snapshot.load(os.path.join(workdir, "config"))["config"]["metrics"]["enabled"] = False
+    core.APIConfig = FakeAPIConfig
+
+    bot = core.DemonOverlord(["run.py", "--dev"], workdir)
+
+    # the real database config with its settings cache, only its pool is fake. it never connects,
+    # so the postgres variables only have to exist
+    for name in env["postgres"].values():
+        os.environ[name] = "offline"
+    bot.database = DatabaseConfig(bot, CONFDIR)
+    bot.database.pool = FakePool(transport)
+
+    # the background services need a gateway connection, they are not part of the hot path
+    for task in asyncio.all_tasks(bot.loop):
+        task.cancel()
+
+    bot.local = False
+
+    # a welcome message and an autorole for the guild, so joins do real work
+    bot.database.pool.welcome[guild.id] = {
+        "guild_id": guild.id,
+        "welcome_channel": guild.channels[0].id,
+        "embed_color": 0xE2268F,
+        "wait_pending": False,
+        "embed_title": "Welcome {user.name} to {server}!",
+        "embed_description": "Hi {user.mention}, please read {#channel-1.mention} and ping {!role 1.mention}.",
+        "embed_image": None,
+        "embed_thumbnail": "{user.icon}",
+        "embed_author": None,
+        "embed_author_img": None,
+    }
+    bot.database.pool.autorole[guild.id] = {"guild_id": guild.id, "role_id": guild.roles[0].id, "wait_pending": True}
+
+    # skip connecting, the bot is ready right away
+    bot._ready.set()
+    bot._db_ready.set()
+    return bot
+
+
+def synthetic_trace(bot, rate: float, duration: float, mix: dict) -> list:
+    """a trace of commands, joins and member updates, evenly spaced at `rate` events per second"""
+    prefix = bot.config.mode["prefix"]
+    commands = [f"{prefix} hello", f"{prefix} help", f"{prefix} help interactions"]
+    commands += [f"{prefix} izzy {link}" for link in bot.commands.izzylinks]
+    commands += [f"{prefix} {action}" for action in bot.commands.interactions["alone"]]
+    commands += [f"{prefix} {action} @member" for action in bot.commands.interactions["social"]]
+
+    events = list(mix)
+    weights = [mix[event] for event in events]
+
+    trace = []
+    for i in range(int(rate * duration)):
+        event = random.choices(events, weights)[0]
+        entry = {"at": i / rate, "event": event}
+        if event == "message":
+            entry["content"] = random.choice(commands)
+        trace.append(entry)
+    return trace
+
+
+class LoadTest(object):
+    """
+    This drives the bot with the events of a trace. Events are started at their scheduled time,
+    whether or not earlier events are finished, like the gateway does.
+    """
+
+    def __init__(self, bot, guild: FakeGuild, transport: FakeTransport):
+        self.bot = bot
+        self.guild = guild
+        self.transport = transport
+        self.latencies = dict()
+        self.errors = dict()
+        self.lag = []
+        self._running = False
+
+    def _message(self, content: str) -> FakeMessage:
+        author = random.choice(self.guild.members[1:])
+        mentions = []
+        if "@member" in content:
+            mentions = [random.choice(self.guild.members[1:])]
+            content = content.replace("@member", mentions[0].mention)
+        return FakeMessage(random.choice(self.guild.channels), author, content, mentions=mentions)
+
+    async def _handle(self, entry: dict, scheduled: float) -> None:
+        event = entry["event"]
+        try:
+            if event == "message":
+                await self.bot.on_message(self._message(entry["content"]))
+            elif event == "join":
+                await self.bot.on_member_join(FakeMember(self.guild, f"new member {random.random()}"))
+            elif event == "update":
+                before = FakeMember(self.guild, f"new member {random.random()}", pending=True)
+                after = FakeMember(self.guild, before.name)
+                await self.bot.on_member_update(before, after)
+        except Exception as e:
+            name = f"{event}: {type(e).__name__}"
+            self.errors[name] = self.errors.get(name, 0) + 1
+        finally:
+            self.latencies.setdefault(event, []).append(time.perf_counter() - scheduled)
+
+    async def _monitor_lag(self, interval: float = 0.01) -> None:
+        """measure how late the event loop wakes up a sleeping task"""
+        while self._running:
+            start = time.perf_counter()
+            await asyncio.sleep(interval)
+            self.lag.append(time.perf_counter() - start - interval)
+
+    async def run(self, trace: list) -> float:
+        self._running = True
+        monitor = asyncio.ensure_future(self._monitor_lag())
+
+        tasks = []
+        start = time.perf_counter()
+        for entry in trace:
+            scheduled = start + entry["at"]
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.ensure_future(self._handle(entry, scheduled)))
+
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+
+        self._running = False
+        await monitor
+        return elapsed
+
+    def report(self, elapsed: float) -> dict:
+        total = sum(len(values) for values in self.latencies.values())
+        result = {
+            "events": total,
+            "seconds": elapsed,
+            "throughput": total / elapsed if elapsed else 0.0,
+            "latency_ms": {
+                event: {
+                    "count": len(values),
+                    "p50": percentile(values, 0.5) * 1000,
+                    "p99": percentile(values, 0.99) * 1000,
+                    "max": max(values) * 1000,
+                }
+                for event, values in self.latencies.items()
+            },
+            "loop_lag_ms": {
+                "p50": percentile(self.lag, 0.5) * 1000,
+                "p99": percentile(self.lag, 0.99) * 1000,
+                "max": max(self.lag, default=0.0) * 1000,
+            },
+            "requests": dict(self.transport.requests),
+            "errors": dict(self.errors),
+        }
+
+        print(f"\n{result['events']} events in {elapsed:.2f}s, {result['throughput']:.1f} events/s")
+        print(f"{'event': <10}{'count': >8}{'p50': >12}{'p99': >12}{'max': >12}")
+        for event, latency in result["latency_ms"].items():
+            print(
+                f"{event: <10}{latency['count']: >8}{latency['p50']: >10.2f}ms"
+                f"{latency['p99']: >10.2f}ms{latency['max']: >10.2f}ms"
+            )
+        lag = result["loop_lag_ms"]
+        print(f"event loop lag: p50 {lag['p50']:.2f}ms, p99 {lag['p99']:.2f}ms, max {lag['max']:.2f}ms")
+        print(f"requests: {result['requests']}")
+        if self.errors:
+            print(f"errors: {result['errors']}")
+        return result
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description="drive the bot with synthetic or recorded gateway events")
+    parser.add_argument("--rate", type=float, default=100, help="events per second")
+    parser.add_argument("--duration", type=float, default=10, help="seconds of synthetic events")
+    parser.add_argument("--latency", type=float, default=50, help="latency of every request in ms")
+    parser.add_argument("--jitter", type=float, default=0, help="additional random latency in ms")
+    parser.add_argument("--members", type=int, default=1000, help="members of the fake guild")
+    parser.add_argument(
+        "--mix", default="message=0.9,join=0.05,update=0.05", help="share of every event type in synthetic traces"
+    )
+    parser.add_argument("--trace", default=None, help="replay a trace file instead of generating events")
+    parser.add_argument("--save-trace", default=None, help="store the generated trace")
+    parser.add_argument("--json", default=None, help="store the report as json")
+    parser.add_argument("--seed", type=int, default=None, help="seed for reproducible synthetic traces")
+    parser.add_argument("--log-level", default="WARNING", help="log level of the bot during the test")
+    args = parser.parse_args(argv)
+
+    random.seed(args.seed)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    transport = FakeTransport(latency=args.latency / 1000, jitter=args.jitter / 1000)
+    guild = FakeGuild(members=args.members, transport=transport)
+    bot = create_bot(guild, transport)
+    logger.configure(args.log_level, "console")
+
+    if args.trace:
+        with open(args.trace) as f:
+            trace = [json.loads(line) for line in f if line.strip()]
+    else:
+        mix = {event: float(share) for event, share in (item.split("=") for item in args.mix.split(","))}
+        trace = synthetic_trace(bot, args.rate, args.duration, mix)
+
+    if args.save_trace:
+        with open(args.save_trace, "w") as f:
+            for entry in trace:
+                f.write(json.dumps(entry) + "\n")
+
+    test = LoadTest(bot, guild, transport)
+    elapsed = loop.run_until_complete(test.run(trace))
+    result = test.report(elapsed)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=4)
+
+    loop.run_until_complete(bot.api.close_connections())
+    loop.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
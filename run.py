@@ -1,38 +1,95 @@
 #!/usr/bin/env python
-import sys, os, asyncio
-from DemonOverlord.core.util.logger import LogCommand, LogFormat, LogMessage, LogType
+import sys, os, asyncio, signal
+import multiprocessing
+from DemonOverlord.core.util.logger import LogCommand, LogFormat, LogMessage, LogType, log, logger
 import DemonOverlord.core.util.services
+from DemonOverlord.core.util.metrics import metrics
 # try importing the module and throw an error if can't be imported
 try:
     from DemonOverlord.core.demonoverlord import DemonOverlord
+    from DemonOverlord.core.util.config import BotConfig
+    from DemonOverlord.core.util import snapshot
 
     missing_module = False
 
 except (ImportError):
     missing_module = True
-    print(
+    log(
         LogMessage(
             f"not all dependencies seem to be installed, please run {LogFormat.format('pip install -Ur requirements.txt', LogFormat.BOLD)}",
-            prefix=f"{LogFormat.format('ERROR', LogFormat.FAIL)}",
+            msg_type=LogType.ERROR,
             time=False,
         )
     )
 
 
-def run():
+WORKDIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "DemonOverlord")
+
+
+def run(shard_ids: list = None, process: int = 0):
     try:
         # initialize the bot
-        workdir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "DemonOverlord")
-        bot = DemonOverlord(sys.argv, workdir)
+        bot = DemonOverlord(sys.argv, WORKDIR, shard_ids=shard_ids, process=process)
 
-        # actually run the bloody thing
-        bot.run(bot.config.token)  # this will block execution from here
+        # actually run the bloody thing, we drive the loop ourselves so it is still open for cleanup
+        bot.loop.run_until_complete(bot.start(bot.config.token))  # this will block execution from here
+    except KeyboardInterrupt:
+        pass
     finally:
         # clean up after ourselves, when we crash or stop
-        print(LogMessage("Bot Stopped, exiting gracefully", msg_type=LogType.WARNING))
-        bot.database.connection_main.close()
-        bot.database.connection_maintenance.close()
+        log(LogMessage("Bot Stopped, exiting gracefully", msg_type=LogType.WARNING))
+        bot.loop.run_until_complete(bot.close())
+        bot.loop.run_until_complete(bot.api.close_connections())
+        bot.loop.run_until_complete(metrics.stop())
+        if bot.database:
+            bot.loop.run_until_complete(bot.database.close())
+        bot.loop.close()
+        logger.close()
+
+
+def main():
+    # validate the config and build its snapshot once, before any process connects
+    try:
+        raw = snapshot.load(os.path.join(WORKDIR, "config"))["config"]
+    except snapshot.ConfigError as e:
+        log(LogMessage(str(e), msg_type=LogType.ERROR, time=False))
+        sys.exit(1)
+
+    # get the shard layout, every group of shards runs in its own process
+    mode, layout = BotConfig.parse_argv(raw, sys.argv)
+    groups = BotConfig.shard_groups(layout)
+
+    if len(groups) == 1:
+        run(groups[0])
+        return
+
+    # spawn fresh interpreters, the children must not inherit our loop or logger thread
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(target=run, args=(group, index), name=f"shards-{group[0]}-{group[-1]}")
+        for index, group in enumerate(groups)
+    ]
+    for process in processes:
+        process.start()
+
+    # SIGHUP reloads the command config, pass it on so `kill -HUP` works on the supervisor as well
+    if hasattr(signal, "SIGHUP"):
+
+        def forward(signum, frame):
+            for process in processes:
+                if process.is_alive():
+                    os.kill(process.pid, signum)
+
+        signal.signal(signal.SIGHUP, forward)
+
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        # the children get the interrupt as well and shut down on their own
+        for process in processes:
+            process.join()
 
 
 if __name__ == "__main__" and not missing_module:
-    run()
+    main()